@@ -0,0 +1,55 @@
+# Read and write throughput of each available gzip backend of open_compressed.
+#
+#   python benchmarks/gzip_backends.py --mb 200 --level 6 --threads 4
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from context import spcount
+from spcount.compress_util import get_available_backends, open_compressed
+
+def build_fastq_block(rnd, num_reads):
+  lines = []
+  for idx in range(num_reads):
+    sequence = "".join(rnd.choice("ACGT") for _ in range(rnd.randint(18, 40)))
+    lines.append(f"@read{idx} 1:N:0:1\n{sequence}\n+\n{'I' * len(sequence)}\n")
+  return("".join(lines))
+
+def run_backend(backend, filename, block, repeat, level, threads):
+  start = time.time()
+  with open_compressed(filename, "wt", level=level, threads=threads, backend=backend) as fout:
+    for _ in range(repeat):
+      fout.write(block)
+  write_seconds = time.time() - start
+
+  start = time.time()
+  lines = 0
+  with open_compressed(filename, "rt", threads=threads, backend=backend) as fin:
+    for line in fin:
+      lines += 1
+  read_seconds = time.time() - start
+
+  mb = len(block) * repeat / 1024 / 1024
+  return({"backend":backend, "mb":round(mb, 1), "compressed_mb":round(os.path.getsize(filename) / 1024 / 1024, 1), "lines":lines,
+    "write_mb_per_second":round(mb / write_seconds, 1), "read_mb_per_second":round(mb / read_seconds, 1)})
+
+def main():
+  parser = argparse.ArgumentParser(description="Throughput of gzip backends")
+  parser.add_argument('--mb', type=int, default=100, help="Uncompressed size (MB)")
+  parser.add_argument('--level', type=int, default=6, help="Compression level")
+  parser.add_argument('--threads', type=int, default=1, help="Number of threads to write")
+  args = parser.parse_args()
+
+  block = build_fastq_block(random.Random(1), 20000)
+  repeat = max(1, args.mb * 1024 * 1024 // len(block))
+  results = []
+  with tempfile.TemporaryDirectory() as folder:
+    for backend in get_available_backends():
+      results.append(run_backend(backend, os.path.join(folder, f"{backend}.fastq.gz"), block, repeat, args.level, args.threads))
+  print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+  main()
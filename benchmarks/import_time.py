@@ -0,0 +1,55 @@
+# Import time of spcount CLI startup and each subcommand, measured by python -X importtime in fresh processes.
+#
+#   python benchmarks/import_time.py --repeat 3
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# modules imported in the branch of each subcommand in spcount/__main__.py, pandas is imported by count_table itself
+COMMAND_MODULES = {
+  '--help': [],
+  'dl_taxonomy': ['spcount.taxonomy_util'],
+  'dl_assembly_summary': ['spcount.database_util'],
+  'dl_genome': ['spcount.database_util'],
+  'bowtie_index': ['spcount.database_util'],
+  'bowtie_batch': ['spcount.bowtie_util'],
+  'bowtie_collapsed': ['spcount.bowtie_util'],
+  'bowtie_count': ['spcount.count_util'],
+  'count_table': ['spcount.count_util', 'pandas'],
+  'krona': ['spcount.visualization_util'],
+}
+
+def measure(modules):
+  code = "; ".join(f"import {module}" for module in ['spcount.__main__'] + modules)
+  env = dict(os.environ, PYTHONPATH=SRC_FOLDER + os.pathsep + os.environ.get('PYTHONPATH', ''))
+  output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, stderr=subprocess.PIPE, check=True, text=True).stderr
+  total = 0
+  top_modules = []
+  for line in output.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    self_us, cumulative_us, name = [part.strip() if idx == 2 else int(part) for idx, part in enumerate(line[len('import time:'):].split('|'))]
+    total += self_us
+    if not name.startswith(' '):
+      top_modules.append((name.strip(), cumulative_us))
+  top_modules.sort(key=lambda x:x[1], reverse=True)
+  return(total / 1000, top_modules[:5])
+
+def main():
+  parser = argparse.ArgumentParser(description="Import time of spcount subcommands")
+  parser.add_argument('--repeat', type=int, default=3, help="Number of runs of each subcommand, the fastest is reported")
+  args = parser.parse_args()
+
+  report = {}
+  for command, modules in COMMAND_MODULES.items():
+    runs = [measure(modules) for _ in range(args.repeat)]
+    total_ms, top_modules = min(runs, key=lambda x:x[0])
+    report[command] = {"import_ms":round(total_ms, 1), "top_modules_ms":{name:round(us / 1000, 1) for name, us in top_modules}}
+  print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,140 @@
+# Time and peak memory of the counting pipeline on a synthetic cohort: bowtie_count of each sample, stages of
+# count_table, merge_queries, krona table preparation and shannon. Each target runs in its own process so the peak
+# RSS is not shared, the report is written as JSON to track regressions.
+#
+#   python benchmarks/pipeline.py --species 500 --samples 10 --reads 100000 --output pipeline.json
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from context import spcount
+from synthetic import SyntheticCohort
+
+TARGETS = ['bowtie_count', 'count_table', 'merge_queries', 'krona', 'shannon']
+
+def get_peak_rss_kb():
+  return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+# Stages are delimited by log messages: each message starts a stage which ends at the next message.
+class StageTimer(logging.Handler):
+  def __init__(self):
+    super().__init__()
+    self.records = []
+
+  def emit(self, record):
+    self.records.append((record.getMessage(), time.time(), get_peak_rss_kb()))
+
+  def get_stages(self, end):
+    result = []
+    for idx, (message, start, peak_rss_kb) in enumerate(self.records):
+      stop = self.records[idx + 1][1] if idx + 1 < len(self.records) else end
+      result.append({"stage":message, "seconds":round(stop - start, 4), "peak_rss_kb_before":peak_rss_kb})
+    return(result)
+
+def get_logger(timer):
+  logger = logging.getLogger('benchmark')
+  logger.setLevel(logging.INFO)
+  logger.propagate = False
+  logger.addHandler(timer)
+  return(logger)
+
+def get_prefix(cohort):
+  return(os.path.join(cohort.folder, "cohort"))
+
+def run_bowtie_count(logger, cohort, threads):
+  from spcount.count_util import bowtie_count
+  for sample, bowtie_list_file, dupcount_file in zip(cohort.samples, cohort.bowtie_list_files, cohort.dupcount_files):
+    bowtie_count(logger, bowtie_list_file, os.path.join(cohort.folder, f"{sample}.bowtie_count.txt.gz"), dupcount_file, cohort.species_file, threads=threads)
+
+def run_count_table(logger, cohort, threads):
+  from spcount.count_util import count_table
+  count_table(logger, cohort.count_list_file, get_prefix(cohort), cohort.taxonomy_file, cohort.species_file, threads=threads)
+
+def run_merge_queries(logger, cohort, threads):
+  from spcount.count_util import read_text_queries, merge_queries
+  for count_file in cohort.count_files:
+    _, queries, _ = read_text_queries(count_file, False)
+    logger.info(f"merging queries of {count_file}")
+    merge_queries(logger, queries)
+
+def run_krona(logger, cohort, threads):
+  from spcount.visualization_util import build_krona_tables
+  group_file = os.path.join(cohort.folder, "group.list")
+  with open(group_file, "wt") as fout:
+    for idx, sample in enumerate(cohort.samples):
+      fout.write(f"{sample}\tgroup{idx % 2}\n")
+  build_krona_tables(logger, get_prefix(cohort) + ".tree.count", group_file, cohort.folder, get_prefix(cohort) + ".krona")
+
+def run_shannon(logger, cohort, threads):
+  from spcount.statistic_util import shannon
+  shannon(logger, get_prefix(cohort) + ".species.estimated.count", get_prefix(cohort) + ".shannon.csv")
+
+def run_target(target, cohort, threads):
+  timer = StageTimer()
+  logger = get_logger(timer)
+  before = get_peak_rss_kb()
+  start = time.time()
+  globals()["run_" + target](logger, cohort, threads)
+  end = time.time()
+  return({"target":target, "seconds":round(end - start, 4), "rss_before_kb":before, "peak_rss_kb":get_peak_rss_kb(), "stages":timer.get_stages(end)})
+
+def main():
+  parser = argparse.ArgumentParser(description="Time and peak memory of spcount pipeline on synthetic data")
+  parser.add_argument('--species', type=int, default=200, help="Number of species")
+  parser.add_argument('--samples', type=int, default=4, help="Number of samples")
+  parser.add_argument('--reads', type=int, default=20000, help="Number of distinct reads")
+  parser.add_argument('--max_hits', type=int, default=8, help="Maximum number of species hit by a multi-mapping read")
+  parser.add_argument('--ambiguity', type=float, default=0.5, help="Fraction of multi-mapping reads")
+  parser.add_argument('--seed', type=int, default=1, help="Random seed")
+  parser.add_argument('--threads', type=int, default=1, help="Threads of bowtie_count and count_table")
+  parser.add_argument('--targets', default=",".join(TARGETS), help="Targets to run, separated by comma")
+  parser.add_argument('--folder', help="Folder of synthetic data, a temporary folder will be used if not set")
+  parser.add_argument('--output', help="Output JSON report, printed to stdout if not set")
+  parser.add_argument('--target', choices=TARGETS, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp_folder:
+    folder = args.folder if args.folder != None else tmp_folder
+    cohort = SyntheticCohort(folder, num_species=args.species, num_samples=args.samples, num_reads=args.reads, max_hits=args.max_hits, ambiguity=args.ambiguity, seed=args.seed)
+
+    if args.target != None:
+      print(json.dumps(run_target(args.target, cohort, args.threads)))
+      return
+
+    if not os.path.exists(cohort.count_list_file):
+      cohort.write(bowtie=True)
+
+    targets = args.targets.split(",")
+    for target in targets:
+      if target not in TARGETS:
+        raise Exception(f"Unknown target {target}, should be one of {TARGETS}")
+    # krona and shannon use the outputs of count_table
+    if ('krona' in targets or 'shannon' in targets) and 'count_table' not in targets and not os.path.exists(get_prefix(cohort) + ".tree.count"):
+      targets.insert(0, 'count_table')
+
+    results = []
+    for target in targets:
+      command = [sys.executable, __file__, "--target", target, "--folder", folder, "--threads", str(args.threads),
+                 "--species", str(args.species), "--samples", str(args.samples), "--reads", str(args.reads),
+                 "--max_hits", str(args.max_hits), "--ambiguity", str(args.ambiguity), "--seed", str(args.seed)]
+      results.append(json.loads(subprocess.check_output(command)))
+
+    report = {
+      "config":{"species":args.species, "samples":args.samples, "reads":args.reads, "max_hits":args.max_hits, "ambiguity":args.ambiguity, "seed":args.seed, "threads":args.threads},
+      "python":sys.version.split(" ")[0],
+      "results":results
+    }
+    if args.output != None:
+      with open(args.output, "wt") as fout:
+        json.dump(report, fout, indent=2)
+    else:
+      print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,97 @@
+# Compare peak RSS of parsing count files into the string based query/species representation
+# used before symbol tables (legacy) and the interned integer representation (interned).
+#
+#   python benchmarks/query_memory.py --samples 20 --reads 200000
+import argparse
+import gzip
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+from context import spcount
+from spcount.count_util import read_file_map, read_query_list, build_species_list
+from spcount.SymbolTable import SymbolTable
+from synthetic import SyntheticCohort
+
+def parse_legacy(file_map):
+  query_list = []
+  for sample, count_file in file_map.items():
+    first_query_map = {}
+    with gzip.open(count_file, "rt") as fin:
+      fin.readline()
+      for bl in fin:
+        bparts = bl.split('\t')
+        query = [sample, bparts[0].split(' ')[0], int(bparts[1]), sorted(bparts[3].rstrip().split(','))]
+        key = tuple(query[3])
+        if key in first_query_map:
+          first_query_map[key][2] += query[2]
+        else:
+          first_query_map[key] = query
+          query_list.append(query)
+
+  species_map = {}
+  for query in query_list:
+    for species in query[3]:
+      if species not in species_map:
+        species_map[species] = [defaultdict(list), defaultdict(set)]
+      species_map[species][0][query[0]].append(query)
+      species_map[species][1][query[0]].add(query[1])
+  return(len(query_list), len(species_map))
+
+def parse_interned(file_map):
+  logger = logging.getLogger('benchmark')
+  species_table = SymbolTable()
+  query_list = read_query_list(logger, file_map, species_table)
+  species_list = build_species_list(query_list, species_table)
+  return(len(query_list), len(species_list))
+
+def get_current_rss_kb():
+  with open("/proc/self/statm", "rt") as fin:
+    return(int(fin.readline().split()[1]) * resource.getpagesize() // 1024)
+
+def run_mode(mode, count_list_file):
+  file_map = read_file_map(count_list_file)
+  before = get_current_rss_kb()
+  if mode == "legacy":
+    queries, species = parse_legacy(file_map)
+  else:
+    queries, species = parse_interned(file_map)
+  after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  print(json.dumps({"mode":mode, "queries":queries, "species":species, "rss_before_kb":before, "peak_rss_kb":after, "peak_increase_kb":after - before}))
+
+def main():
+  parser = argparse.ArgumentParser(description="Peak memory of query/species representations")
+  parser.add_argument('--species', type=int, default=500, help="Number of species")
+  parser.add_argument('--samples', type=int, default=10, help="Number of samples")
+  parser.add_argument('--reads', type=int, default=100000, help="Number of distinct reads")
+  parser.add_argument('--folder', help="Folder of synthetic data, a temporary folder will be used if not set")
+  parser.add_argument('--mode', choices=["legacy", "interned"], help=argparse.SUPPRESS)
+  parser.add_argument('--count_list', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.mode != None:
+    run_mode(args.mode, args.count_list)
+    return
+
+  with tempfile.TemporaryDirectory() as tmp_folder:
+    folder = args.folder if args.folder != None else tmp_folder
+    cohort = SyntheticCohort(folder, num_species=args.species, num_samples=args.samples, num_reads=args.reads)
+    if not os.path.exists(cohort.count_list_file):
+      cohort.write()
+
+    results = []
+    for mode in ["legacy", "interned"]:
+      output = subprocess.check_output([sys.executable, __file__, "--mode", mode, "--count_list", cohort.count_list_file])
+      results.append(json.loads(output))
+
+    legacy, interned = results
+    report = {"legacy":legacy, "interned":interned, "peak_increase_ratio":legacy["peak_increase_kb"] / max(1, interned["peak_increase_kb"])}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,147 @@
+import gzip
+import os
+import random
+
+RANKS = ['superkingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+
+# Deterministic synthetic cohort for benchmarks. Species are grouped into a balanced lineage,
+# some of them are subset or identical to their neighbours, and reads hit 1 to max_hits species.
+# Besides bowtie_count outputs, the dupcount file and gzipped bowtie output chunks of each sample can be written as
+# input of bowtie_count.
+class SyntheticCohort(object):
+  def __init__(self, folder, num_species=200, num_samples=4, num_reads=20000, max_hits=8, ambiguity=0.5, seed=1, bowtie_chunks=2):
+    self.folder = folder
+    self.num_species = num_species
+    self.num_samples = num_samples
+    self.num_reads = num_reads
+    self.max_hits = max_hits
+    self.ambiguity = ambiguity
+    self.seed = seed
+    self.bowtie_chunks = bowtie_chunks
+
+    self.taxonomy_file = os.path.join(folder, "taxonomy.txt")
+    self.species_file = os.path.join(folder, "species.taxonomy.txt")
+    self.count_list_file = os.path.join(folder, "count.list")
+    self.samples = [f"S{idx+1:03d}" for idx in range(num_samples)]
+    self.count_files = [os.path.join(folder, f"{sample}.count.txt.gz") for sample in self.samples]
+    self.dupcount_files = [os.path.join(folder, f"{sample}.dupcount") for sample in self.samples]
+    self.bowtie_list_files = [os.path.join(folder, f"{sample}.bowtie.list") for sample in self.samples]
+
+  def get_lineage(self, idx):
+    group = idx // 3
+    return({
+      'superkingdom': 'Bacteria',
+      'phylum': f'phylum{group // 16}',
+      'class': f'class{group // 8}',
+      'order': f'order{group // 4}' if group % 7 else 'Unclassified',
+      'family': f'family{group // 2}',
+      'genus': f'genus{group}' if idx % 11 else 'Unclassified',
+      'species': f'species{idx}',
+    })
+
+  def get_chromosomes(self, idx):
+    return([f"species{idx}_chr{chrom}" for chrom in range(2)])
+
+  def write_taxonomy(self):
+    lineages = [self.get_lineage(idx) for idx in range(self.num_species)]
+    names = sorted(set(name for lineage in lineages for name in lineage.values()))
+    with open(self.taxonomy_file, "wt") as fout:
+      fout.write("Id\tParentId\tScientificName\tRank\n")
+      for idx, name in enumerate(names):
+        fout.write(f"{idx+10}\t1\t{name}\tno rank\n")
+
+    with open(self.species_file, "wt") as fout:
+      fout.write("chrom\taccession\tscientific_name\ttaxid\trank\tsuperkingdom\tkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\n")
+      for idx, lineage in enumerate(lineages):
+        for chrom in self.get_chromosomes(idx):
+          fout.write(f"{chrom}\tGCF_{idx:09d}\t{lineage['species']}\t{idx+1000}\tspecies\t{lineage['superkingdom']}\t\t{lineage['phylum']}\t{lineage['class']}\t{lineage['order']}\t{lineage['family']}\t{lineage['genus']}\t{lineage['species']}\n")
+
+  # each distinct sequence has a fixed set of hit species
+  def build_reads(self, rnd):
+    result = []
+    for idx in range(self.num_reads):
+      sequence = "".join(rnd.choice("ACGT") for _ in range(rnd.randint(18, 32)))
+      base = rnd.randrange(self.num_species)
+      hits = set([base])
+      if rnd.random() < self.ambiguity:
+        num_hits = rnd.randint(2, self.max_hits)
+        while len(hits) < num_hits:
+          if rnd.random() < 0.7:
+            hits.add(min(self.num_species - 1, max(0, base + rnd.randint(-4, 4))))
+          else:
+            hits.add(rnd.randrange(self.num_species))
+      for hit in list(hits):
+        if hit % 5 == 4:
+          hits.add(hit - 1)
+        if hit % 10 == 2 and hit + 1 < self.num_species:
+          hits.add(hit + 1)
+        if hit % 10 == 3:
+          hits.add(hit - 1)
+      result.append([sequence, sorted(hits)])
+    return(result)
+
+  def build_sample_reads(self, rnd, reads):
+    result = []
+    for sample in self.samples:
+      chosen = rnd.sample(range(len(reads)), len(reads) * 2 // 3)
+      rows = [[f"{sample}_{ri}", rnd.choice([1, 1, 1, 2, 3, 5, 10, 50]), reads[read_idx]] for ri, read_idx in enumerate(chosen)]
+      rows.sort(key=lambda x:x[1], reverse=True)
+      result.append(rows)
+    return(result)
+
+  def get_sample_reads(self):
+    rnd = random.Random(self.seed)
+    reads = self.build_reads(rnd)
+    return(self.build_sample_reads(rnd, reads))
+
+  # bowtie_count output of each sample and the list file of count_table
+  def write_count_files(self, sample_reads):
+    for count_file, rows in zip(self.count_files, sample_reads):
+      with gzip.open(count_file, "wt") as fout:
+        fout.write("read\tcount\tsequence\tspecies\n")
+        for name, count, read in rows:
+          species = ",".join(f"species{idx}" for idx in read[1])
+          fout.write(f"{name}\t{count}\t{read[0]}\t{species}\n")
+
+    with open(self.count_list_file, "wt") as fout:
+      for count_file, sample in zip(self.count_files, self.samples):
+        fout.write(f"{count_file}\t{sample}\n")
+
+  # Input of bowtie_count of each sample: dupcount file with extra unmapped reads, and bowtie outputs split into chunks.
+  # Each read hits one or both chromosomes of its species, alignments of a read are adjacent as bowtie outputs them.
+  def write_bowtie_files(self, sample_reads):
+    rnd = random.Random(self.seed + 1)
+    for sample, dupcount_file, bowtie_list_file, rows in zip(self.samples, self.dupcount_files, self.bowtie_list_files, sample_reads):
+      with open(dupcount_file, "wt") as fout:
+        fout.write("Query\tCount\tSequence\n")
+        for name, count, read in rows:
+          fout.write(f"{name}\t{count}\t{read[0]}\n")
+        for idx in range(len(rows) // 10):
+          sequence = "".join(rnd.choice("ACGT") for _ in range(rnd.randint(18, 32)))
+          fout.write(f"{sample}_unmapped{idx}\t1\t{sequence}\n")
+
+      bowtie_files = [os.path.join(self.folder, f"{sample}.chunk{chunk}.bowtie.gz") for chunk in range(self.bowtie_chunks)]
+      fouts = [gzip.open(bowtie_file, "wt") for bowtie_file in bowtie_files]
+      for ri, (name, count, read) in enumerate(rows):
+        fout = fouts[ri % len(fouts)]
+        sequence = read[0]
+        for hit in read[1]:
+          chromosomes = self.get_chromosomes(hit)
+          for chrom in (chromosomes if rnd.random() < 0.3 else [rnd.choice(chromosomes)]):
+            fout.write(f"{name}\t+\t{chrom}\t{rnd.randint(0, 100000)}\t{sequence}\t{'I' * len(sequence)}\t0\t\n")
+      for fout in fouts:
+        fout.close()
+
+      with open(bowtie_list_file, "wt") as fout:
+        for bowtie_file in bowtie_files:
+          fout.write(f"{bowtie_file}\n")
+
+  def write(self, bowtie=False):
+    if not os.path.exists(self.folder):
+      os.makedirs(self.folder)
+    self.write_taxonomy()
+    sample_reads = self.get_sample_reads()
+    self.write_count_files(sample_reads)
+    if bowtie:
+      self.write_bowtie_files(sample_reads)
+    return(self)
@@ -0,0 +1,117 @@
+import struct
+import zipfile
+import numpy as np
+
+BASES = b"ACGT"
+BASE_CODES = np.full(256, 255, dtype=np.uint8)
+BASE_CODES[np.frombuffer(BASES, dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+
+# Count bundle is detected by the zip signature of npz file, so it is found whatever the file name is.
+def is_count_bundle(count_file):
+  with open(count_file, "rb") as fin:
+    return(fin.read(4) == b"PK\x03\x04")
+
+# Sequences are concatenated and packed by 2 bits per base. Bases other than ACGT are stored as exceptions
+# by position in the concatenated sequence.
+def pack_sequences(sequences):
+  lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+  data = np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8)
+  codes = BASE_CODES[data]
+  exception_positions = np.flatnonzero(codes == 255)
+  exception_bases = data[exception_positions]
+  codes[exception_positions] = 0
+  codes = np.concatenate([codes, np.zeros((-len(codes)) % 4, dtype=np.uint8)]).reshape(-1, 4)
+  packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+  return(lengths, packed.astype(np.uint8), exception_positions, exception_bases)
+
+def unpack_sequences(lengths, packed, exception_positions, exception_bases):
+  total = int(lengths.sum())
+  codes = np.empty((len(packed), 4), dtype=np.uint8)
+  for idx, shift in enumerate([6, 4, 2, 0]):
+    codes[:, idx] = (packed >> shift) & 3
+  data = np.frombuffer(BASES, dtype=np.uint8)[codes.ravel()[:total]]
+  data[exception_positions] = exception_bases
+  text = data.tobytes().decode("ascii")
+  ends = np.cumsum(lengths).tolist()
+  starts = [0] + ends[:-1]
+  return([text[start:end] for start, end in zip(starts, ends)])
+
+# Arrays of uncompressed npz file are memory-mapped by their offsets in the zip file.
+def load_npz_mmap(filename):
+  result = {}
+  with zipfile.ZipFile(filename) as zf, open(filename, "rb") as fin:
+    for info in zf.infolist():
+      name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+      if info.compress_type != zipfile.ZIP_STORED:
+        with zf.open(info) as fa:
+          result[name] = np.lib.format.read_array(fa)
+        continue
+
+      fin.seek(info.header_offset)
+      name_length, extra_length = struct.unpack("<HH", fin.read(30)[26:30])
+      fin.seek(info.header_offset + 30 + name_length + extra_length)
+      version = np.lib.format.read_magic(fin)
+      if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fin)
+      else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fin)
+      if int(np.prod(shape)) == 0:
+        result[name] = np.empty(shape, dtype=dtype)
+      else:
+        result[name] = np.memmap(filename, dtype=dtype, mode="r", offset=fin.tell(), shape=shape, order="F" if fortran_order else "C")
+  return(result)
+
+# Binary columnar version of bowtie_count output, stored as uncompressed npz.
+# Species of each read are stored in CSR layout (indptr/indices) as ids of species dictionary which is sorted by name,
+# read names are stored as utf-8 bytes with offsets, sequences are packed by 2 bits.
+class CountBundle(object):
+  def __init__(self, arrays):
+    self.arrays = arrays
+    self.counts = arrays["counts"]
+    self.indptr = arrays["indptr"]
+    self.indices = arrays["indices"]
+    self.species = arrays["species"]
+
+  def __len__(self):
+    return(len(self.counts))
+
+  # number of rows to read, only first 10000 rows are used in debug mode
+  def get_row_count(self, debug_mode=False):
+    return(min(len(self.counts), 10000) if debug_mode else len(self.counts))
+
+  @classmethod
+  def load(cls, filename):
+    return(cls(load_npz_mmap(filename)))
+
+  @classmethod
+  def write(cls, filename, read_names, counts, sequences, species_names, species_sets):
+    name_data = [name.encode("utf-8") for name in read_names]
+    name_offsets = np.zeros(len(name_data) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(name) for name in name_data), dtype=np.int64, count=len(name_data)), out=name_offsets[1:])
+    indptr = np.zeros(len(species_sets) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(species_set) for species_set in species_sets), dtype=np.int64, count=len(species_sets)), out=indptr[1:])
+    indices = np.fromiter((species_id for species_set in species_sets for species_id in species_set), dtype=np.int32, count=indptr[-1])
+    seq_lengths, seq_packed, seq_exception_positions, seq_exception_bases = pack_sequences(sequences)
+    with open(filename, "wb") as fout:
+      np.savez(fout,
+        species=np.array(species_names, dtype=str),
+        names=np.frombuffer(b"".join(name_data), dtype=np.uint8),
+        name_offsets=name_offsets,
+        counts=np.asarray(counts, dtype=np.int64),
+        indptr=indptr,
+        indices=indices,
+        seq_lengths=seq_lengths,
+        seq_packed=seq_packed,
+        seq_exception_positions=seq_exception_positions,
+        seq_exception_bases=seq_exception_bases)
+
+  def get_read_names(self):
+    data = self.arrays["names"].tobytes()
+    offsets = self.arrays["name_offsets"].tolist()
+    return([data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])])
+
+  def get_sequences(self):
+    return(unpack_sequences(self.arrays["seq_lengths"], self.arrays["seq_packed"], self.arrays["seq_exception_positions"], self.arrays["seq_exception_bases"]))
+
+  def get_species_names(self, row):
+    return([str(self.species[species_id]) for species_id in self.indices[self.indptr[row]:self.indptr[row + 1]]])
@@ -0,0 +1,52 @@
+import numpy as np
+
+# Sparse feature x sample count matrix in CSR layout. Each feature row has a label which may contain
+# multiple tab separated columns. Missing entries are written as "0", stored entries are formatted
+# by value_format in blocks of rows.
+class CountMatrix(object):
+  def __init__(self, labels, indptr, indices, values, num_samples):
+    self.labels = labels
+    self.indptr = indptr
+    self.indices = indices
+    self.values = values
+    self.num_samples = num_samples
+
+  # build from dict of sample to value of each feature. If sample_index is None, the keys are sample indecies.
+  @classmethod
+  def from_dicts(cls, labels, sample_values, num_samples, sample_index=None, dtype=np.int64):
+    indptr = np.zeros(len(sample_values) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(sv) for sv in sample_values), dtype=np.int64, count=len(sample_values)), out=indptr[1:])
+    if sample_index == None:
+      indices = np.fromiter((sample for sv in sample_values for sample in sv.keys()), dtype=np.int32, count=indptr[-1])
+    else:
+      indices = np.fromiter((sample_index[sample] for sv in sample_values for sample in sv.keys()), dtype=np.int32, count=indptr[-1])
+    values = np.fromiter((value for sv in sample_values for value in sv.values()), dtype=dtype, count=indptr[-1])
+    return(cls(labels, indptr, indices, values, num_samples))
+
+  # build from dense matrix, the entries not in present mask are treated as missing.
+  @classmethod
+  def from_dense(cls, labels, matrix, present=None):
+    if present is None:
+      present = matrix != 0
+    rows, indices = np.nonzero(present)
+    indptr = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=matrix.shape[0]), out=indptr[1:])
+    return(cls(labels, indptr, indices.astype(np.int32), matrix[rows, indices], matrix.shape[1]))
+
+  def __len__(self):
+    return(len(self.labels))
+
+  def format_block(self, start, end, value_format):
+    block = np.full((end - start, self.num_samples), "0", dtype=object)
+    entry_start = self.indptr[start]
+    entry_end = self.indptr[end]
+    if entry_end > entry_start:
+      rows = np.repeat(np.arange(end - start), np.diff(self.indptr[start:end+1]))
+      block[rows, self.indices[entry_start:entry_end]] = np.char.mod(value_format, self.values[entry_start:entry_end])
+    return("".join(f"{label}\t" + "\t".join(row) + "\n" for label, row in zip(self.labels[start:end], block.tolist())))
+
+  def write(self, output_file, label_headers, samples, value_format="%d", block_size=10000):
+    with open(output_file, "wt") as fout:
+      fout.write("\t".join(label_headers + samples) + "\n")
+      for start in range(0, len(self.labels), block_size):
+        fout.write(self.format_block(start, min(start + block_size, len(self.labels)), value_format))
@@ -0,0 +1,50 @@
+import numpy as np
+
+# Roll up query and estimated counts of species to their categories at all levels.
+# Categories of all levels share one code space: each level takes a range of codes assigned by first occurrence
+# in species_list. The query count of a category is the sum of distinct queries hitting any of its species,
+# the estimated count is the sum of its species estimated counts.
+class LevelRollup(object):
+  def __init__(self, species_taxonomy_map, species_list, num_species, levels=['genus', 'family', 'order', 'class', 'phylum']):
+    self.levels = levels
+    self.names = []
+    self.level_ranges = []
+    self.species_ids = np.array([species.id for species in species_list], dtype=np.int64)
+    self.species_codes = np.full((len(levels), num_species), -1, dtype=np.int64)
+    for li, level in enumerate(levels):
+      start = len(self.names)
+      codes = {}
+      for species in species_list:
+        cat_name = species_taxonomy_map[species.name][level]
+        code = codes.get(cat_name)
+        if code == None:
+          code = len(self.names)
+          codes[cat_name] = code
+          self.names.append(cat_name)
+        self.species_codes[li, species.id] = code
+      self.level_ranges.append((start, len(self.names)))
+
+  # species_estimated is species x sample in species_list order, the rows are summed in that order.
+  # Levels are rolled up one by one so only the entries of one level are held at a time.
+  # Return {level: (category names, query count matrix, estimated count matrix)}, categories sorted by query count descending.
+  def rollup(self, query_store, species_estimated):
+    num_samples = query_store.num_samples
+    entry_queries = query_store.get_entry_queries()
+    estimated_samples = np.tile(np.arange(num_samples, dtype=np.int64), len(self.species_ids))
+    estimated_values = species_estimated.ravel()
+
+    result = {}
+    for li, (level, (start, end)) in enumerate(zip(self.levels, self.level_ranges)):
+      num_codes = end - start
+      level_codes = self.species_codes[li]
+
+      pairs = np.unique(entry_queries * num_codes + (level_codes[query_store.indices] - start))
+      pair_queries = pairs // num_codes
+      query_matrix = query_store.sum_matrix(pairs % num_codes, query_store.sample_ids[pair_queries], query_store.counts[pair_queries], num_codes)
+
+      rows = np.repeat(level_codes[self.species_ids] - start, num_samples)
+      estimated_matrix = query_store.sum_matrix(rows, estimated_samples, estimated_values, num_codes)
+
+      order = np.argsort(-query_matrix.sum(axis=1), kind='stable')
+      result[level] = ([self.names[start + code] for code in order], query_matrix[order], estimated_matrix[order])
+    return(result)
@@ -0,0 +1,56 @@
+import numpy as np
+
+# Columnar representation of query list. Each query has sample id, query id and count in parallel arrays,
+# its species ids are stored in CSR layout (indptr/indices). Counts of species or groups are summed as
+# sparse matrix products by bincount, the result is a dense matrix with samples as columns.
+class QueryStore(object):
+  def __init__(self, sample_ids, query_ids, counts, indptr, indices, num_samples):
+    self.sample_ids = sample_ids
+    self.query_ids = query_ids
+    self.counts = counts
+    self.indptr = indptr
+    self.indices = indices
+    self.num_samples = num_samples
+
+  @classmethod
+  def from_query_list(cls, query_list, num_samples):
+    num_queries = len(query_list)
+    sample_ids = np.fromiter((q.sample for q in query_list), dtype=np.int32, count=num_queries)
+    query_ids = np.fromiter((q.name for q in query_list), dtype=np.int64, count=num_queries)
+    counts = np.fromiter((q.count for q in query_list), dtype=np.int64, count=num_queries)
+    lengths = np.fromiter((len(q.species_list) for q in query_list), dtype=np.int64, count=num_queries)
+    indptr = np.zeros(num_queries + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    itemsize = query_list[0].species_list.itemsize if num_queries > 0 else 4
+    indices = np.frombuffer(b"".join(q.species_list.tobytes() for q in query_list), dtype=np.dtype(f"i{itemsize}")).astype(np.int32)
+    return(cls(sample_ids, query_ids, counts, indptr, indices, num_samples))
+
+  def __len__(self):
+    return(len(self.counts))
+
+  def get_lengths(self):
+    return(np.diff(self.indptr))
+
+  # query index of each species entry
+  def get_entry_queries(self):
+    return(np.repeat(np.arange(len(self.counts), dtype=np.int64), self.get_lengths()))
+
+  # count of each query is equally distributed to its species
+  def estimate_counts(self):
+    return(self.counts / self.get_lengths())
+
+  def sum_matrix(self, rows, sample_ids, values, num_rows):
+    keys = rows.astype(np.int64) * self.num_samples + sample_ids
+    result = np.bincount(keys, weights=values, minlength=num_rows * self.num_samples).reshape(num_rows, self.num_samples)
+    if np.issubdtype(values.dtype, np.integer):
+      result = result.astype(np.int64)
+    return(result)
+
+  # sum values of queries to each species (species x sample)
+  def sum_by_species(self, values, num_species):
+    entry_queries = self.get_entry_queries()
+    return(self.sum_matrix(self.indices, self.sample_ids[entry_queries], values[entry_queries], num_species))
+
+  # sum values of queries to the group assigned to each query (group x sample)
+  def sum_by_group(self, query_groups, values, num_groups):
+    return(self.sum_matrix(query_groups, self.sample_ids, values, num_groups))
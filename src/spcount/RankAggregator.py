@@ -0,0 +1,183 @@
+import numpy as np
+from collections import OrderedDict
+
+AMBIGUOUS_RANKS = "AmbiguousRanks"
+UNCLASSIFIED = "Unclassified"
+
+# Bounded LRU map from (species set, rank, aggregate_rate) to aggregated name code.
+class DecisionCache(object):
+  def __init__(self, max_size=1000000):
+    self.max_size = max_size
+    self.decisions = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    result = self.decisions.get(key)
+    if result == None:
+      self.misses += 1
+    else:
+      self.hits += 1
+      self.decisions.move_to_end(key)
+    return(result)
+
+  def put(self, key, value):
+    self.decisions[key] = value
+    self.decisions.move_to_end(key)
+    if len(self.decisions) > self.max_size:
+      self.decisions.popitem(last=False)
+
+  def __len__(self):
+    return(len(self.decisions))
+
+  def summary(self):
+    return(f"{self.hits} hits, {self.misses} misses, {len(self.decisions)} cached")
+
+# Aggregate queries to taxonomy ranks in batch.
+# The species_taxonomy_map is encoded as integer matrix (species x rank) and the distinct species sets of queries, arrays of
+# species ids in species_table, are stored in CSR layout. The majority rank name of a species set is chosen by count, ties
+# are resolved by first occurrence in species_list, same as pandas value_counts.
+# Decisions are memorized by (species set, rank, aggregate_rate) and shared by all ranks and the unique node pass.
+class RankAggregator(object):
+  def __init__(self, species_taxonomy_map, query_list, species_table, ranks=['species', 'genus', 'family', 'order', 'class', 'phylum', 'superkingdom'], cache_size=1000000):
+    self.names = []
+    self.name_codes = {}
+    self.ambiguous_code = self.get_code(AMBIGUOUS_RANKS)
+    self.unclassified_code = self.get_code(UNCLASSIFIED)
+
+    self.rank_columns = {rank:idx for idx, rank in enumerate(ranks)}
+    species_rows = {}
+    species_codes = []
+    matrix = []
+    for species, taxonomy in species_taxonomy_map.items():
+      species_rows[species] = len(matrix)
+      species_codes.append(self.get_code(species))
+      matrix.append([self.get_code(taxonomy[rank]) for rank in ranks])
+    self.species_codes = np.array(species_codes, dtype=np.int64)
+    self.taxonomy_matrix = np.array(matrix, dtype=np.int64).reshape(len(matrix), len(ranks))
+    species_id_rows = np.array([species_rows[species] for species in species_table.names], dtype=np.int64)
+    self.species_table = species_table
+
+    self.query_list = query_list
+    self.query_ranks = np.array([q.rank for q in query_list], dtype=object)
+
+    set_ids = {}
+    self.set_keys = []
+    query_set_ids = []
+    for q in query_list:
+      key = q.species_list.tobytes()
+      set_id = set_ids.get(key)
+      if set_id == None:
+        set_id = len(self.set_keys)
+        set_ids[key] = set_id
+        self.set_keys.append(key)
+      query_set_ids.append(set_id)
+    set_ids = None
+    self.query_set_ids = np.array(query_set_ids, dtype=np.int64)
+
+    itemsize = query_list[0].species_list.itemsize if len(query_list) > 0 else 4
+    self.lengths = np.fromiter((len(key) // itemsize for key in self.set_keys), dtype=np.int64, count=len(self.set_keys))
+    self.indptr = np.zeros(len(self.set_keys) + 1, dtype=np.int64)
+    np.cumsum(self.lengths, out=self.indptr[1:])
+    self.indices = species_id_rows[np.frombuffer(b"".join(self.set_keys), dtype=np.dtype(f"i{itemsize}"))]
+
+    self.cache = DecisionCache(cache_size)
+
+  def get_code(self, name):
+    code = self.name_codes.get(name)
+    if code == None:
+      code = len(self.names)
+      self.name_codes[name] = code
+      self.names.append(name)
+    return(code)
+
+  def get_name(self, code):
+    return(self.names[code])
+
+  # return majority name code and its ratio of each species set at the rank
+  def get_majority(self, rank, set_ids):
+    set_count = len(set_ids)
+    name_count = len(self.names)
+    lengths = self.lengths[set_ids]
+    starts = np.repeat(self.indptr[set_ids], lengths)
+    offsets = np.arange(len(starts), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    codes = self.taxonomy_matrix[self.indices[starts + offsets], self.rank_columns[rank]]
+    keys = np.repeat(np.arange(set_count, dtype=np.int64), lengths) * name_count + codes
+
+    unique_keys, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+    key_sets = unique_keys // name_count
+    order = np.lexsort((first_index, -counts, key_sets))
+    sorted_sets = key_sets[order]
+    is_top = np.ones(len(order), dtype=bool)
+    is_top[1:] = sorted_sets[1:] != sorted_sets[:-1]
+    top = order[is_top]
+
+    major_codes = np.full(set_count, -1, dtype=np.int64)
+    major_counts = np.zeros(set_count, dtype=np.int64)
+    major_codes[key_sets[top]] = unique_keys[top] % name_count
+    major_counts[key_sets[top]] = counts[top]
+    with np.errstate(divide='ignore', invalid='ignore'):
+      ratios = major_counts / lengths
+    return(major_codes, ratios)
+
+  # return aggregated name code of each species set at the rank, AmbiguousRanks if the majority ratio is less than aggregate_rate
+  def get_decisions(self, rank, aggregate_rate):
+    result = np.empty(len(self.set_keys), dtype=np.int64)
+    missing = []
+    for set_id, key in enumerate(self.set_keys):
+      code = self.cache.get((key, rank, aggregate_rate))
+      if code == None:
+        missing.append(set_id)
+      else:
+        result[set_id] = code
+
+    if len(missing) > 0:
+      missing = np.array(missing, dtype=np.int64)
+      codes, ratios = self.get_majority(rank, missing)
+      decisions = np.where(ratios >= aggregate_rate, codes, self.ambiguous_code)
+      result[missing] = decisions
+      for set_id, code in zip(missing.tolist(), decisions.tolist()):
+        self.cache.put((self.set_keys[set_id], rank, aggregate_rate), code)
+    return(result)
+
+  def get_single_species_codes(self, query_mask):
+    return(self.species_codes[self.indices[self.indptr[self.query_set_ids[query_mask]]]])
+
+  # aggregate each query to specific rank. The query doesn't aggregated to one node will be assigned to AmbiguousRanks.
+  # Return name code of each query.
+  def aggregate_to_rank(self, rank, aggregate_rate=0.95):
+    result = self.get_decisions(rank, aggregate_rate)[self.query_set_ids]
+
+    own_rank = self.query_ranks == rank
+    if own_rank.any():
+      query_lengths = self.lengths[self.query_set_ids]
+      single = own_rank & (query_lengths == 1)
+      result[single] = self.get_single_species_codes(single)
+      result[own_rank & (query_lengths != 1)] = self.ambiguous_code
+    return(result)
+
+  # aggregate each query to unique node, the first rank whose majority ratio passes aggregate_rate and is not Unclassified.
+  # Return rank and name code of each query.
+  def get_unique_rank(self, ranks=['genus', 'family', 'order', 'class', 'phylum', 'superkingdom'], aggregate_rate=0.95):
+    query_count = len(self.query_set_ids)
+    single = self.lengths[self.query_set_ids] == 1
+    result_ranks = np.full(query_count, "", dtype=object)
+    result_ranks[single] = self.query_ranks[single]
+    result_codes = np.full(query_count, -1, dtype=np.int64)
+    result_codes[single] = self.get_single_species_codes(single)
+
+    pending = ~single
+    for rank in ranks:
+      if not pending.any():
+        break
+      codes = self.get_decisions(rank, aggregate_rate)[self.query_set_ids]
+      found = pending & (codes != self.ambiguous_code) & (codes != self.unclassified_code)
+      result_ranks[found] = rank
+      result_codes[found] = codes[found]
+      pending &= ~found
+
+    if pending.any():
+      query = self.query_list[np.flatnonzero(pending)[0]]
+      raise Exception(f"Cannot find aggregated rank for {'.'.join(self.species_table.get_names(query.species_list))}")
+
+    return(result_ranks, result_codes)
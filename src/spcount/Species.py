@@ -1,16 +1,18 @@
-
+import numpy as np
+from array import array
 from collections import defaultdict
 from .Query import Query
 
 class Species(object):
-  __slots__ = "name", "rank", "taxid", "queries", "queries_set", "is_subset", "is_identical", "identical_species", "sample_query_count", "query_count", "sub_species", "sample_estimated_count", "estimated_count"
+  __slots__ = "id", "name", "rank", "taxid", "queries", "queries_set", "is_subset", "is_identical", "identical_species", "sample_query_count", "query_count", "sub_species", "sample_estimated_count", "estimated_count"
 
-  def __init__(self, name, rank=""):
+  def __init__(self, name, rank="", id=-1):
+    self.id = id
     self.name = name
     self.rank = rank
     self.taxid = ""
     self.queries = defaultdict(list)
-    self.queries_set = defaultdict(set)
+    self.queries_set = {}
     self.is_subset = False
     self.is_identical = False
     self.identical_species = []
@@ -19,7 +21,11 @@ class Species(object):
   
   def add_query(self, query):
     self.queries[query.sample].append(query)
-    self.queries_set[query.sample].add(query.name)
+
+  # queries_set stores sorted query ids of each sample, it is required by contains and identical checking.
+  # Query ids are global in cohort, so they are stored as 64-bit.
+  def build_queries_set(self):
+    self.queries_set = {sample:array('q', sorted(q.name for q in queries)) for sample, queries in self.queries.items()}
 
   def sum_query_count(self):
     self.sample_query_count = {sample:sum([q.count for q in self.queries[sample]]) for sample in self.queries.keys()}
@@ -50,9 +56,12 @@ class Species(object):
         return(False)
 
     for sample in another.queries.keys():
-      another_q = another.queries_set[sample]
-      self_q = self.queries_set[sample]
-      if not another_q.issubset(self_q):
-          return(False)
+      another_q = np.frombuffer(another.queries_set[sample], dtype=np.int64)
+      self_q = np.frombuffer(self.queries_set[sample], dtype=np.int64)
+      if len(another_q) > len(self_q):
+        return(False)
+      positions = np.searchsorted(self_q, another_q)
+      if positions[-1] >= len(self_q) or not np.array_equal(self_q[positions], another_q):
+        return(False)
       
     return(True)
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import pickle
+
+# increase it when the state saved in checkpoint is changed
+CHECKPOINT_VERSION = 2
+
+def get_file_hash(filename, block_size=1024 * 1024):
+  result = hashlib.sha1()
+  with open(filename, "rb") as fin:
+    while True:
+      block = fin.read(block_size)
+      if not block:
+        break
+      result.update(block)
+  return(result.hexdigest())
+
+# Checkpoints of stages are pickled in folder as <stage>.<key>.pickle. The key is hashed from content of input files
+# and parameters, so a rerun with same inputs resumes from the saved stages, and the checkpoints of other keys are stale
+# and removed.
+class StageCheckpoint(object):
+  def __init__(self, logger, folder, input_files, parameters):
+    self.logger = logger
+    self.folder = folder
+
+    key = hashlib.sha1(f"{CHECKPOINT_VERSION}\t{sorted(parameters.items())}".encode("utf-8"))
+    for input_file in input_files:
+      key.update(f"\t{get_file_hash(input_file)}".encode("utf-8"))
+    self.key = key.hexdigest()
+
+    os.makedirs(folder, exist_ok=True)
+    for filename in os.listdir(folder):
+      if f".{self.key}." not in filename:
+        logger.info(f"removing stale checkpoint {filename}")
+        os.remove(os.path.join(folder, filename))
+
+  def get_file(self, stage):
+    return(os.path.join(self.folder, f"{stage}.{self.key}.pickle"))
+
+  def exists(self, stage):
+    return(os.path.exists(self.get_file(stage)))
+
+  # return saved state of stage, or None if the stage was not done
+  def load(self, stage):
+    if not self.exists(stage):
+      return(None)
+    self.logger.info(f"resuming from checkpoint of stage {stage} ...")
+    with open(self.get_file(stage), "rb") as fin:
+      return(pickle.load(fin))
+
+  def save(self, stage, state):
+    checkpoint_file = self.get_file(stage)
+    self.logger.info(f"saving checkpoint of stage {stage} ...")
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file, "wb") as fout:
+      pickle.dump(state, fout, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, checkpoint_file)
+
+  # remove checkpoint of stage which is covered by the checkpoint of a later stage
+  def remove(self, stage):
+    if self.exists(stage):
+      os.remove(self.get_file(stage))
+
+  # remove all checkpoints after the whole job is done
+  def clear(self):
+    for filename in os.listdir(self.folder):
+      os.remove(os.path.join(self.folder, filename))
+    os.rmdir(self.folder)
@@ -0,0 +1,82 @@
+import cProfile
+import json
+import resource
+import time
+
+def get_usage():
+  self_usage = resource.getrusage(resource.RUSAGE_SELF)
+  children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+  cpu = self_usage.ru_utime + self_usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime
+  return(time.time(), cpu, self_usage.ru_maxrss, children_usage.ru_maxrss)
+
+# Record wall time, cpu time (including finished child processes), peak RSS and item counts of named stages.
+# A stage lasts until the next stage is started or the profiler is stopped. If cprofile is set, each stage is
+# profiled by cProfile and the stats of the slowest stage are kept, only the main process is profiled.
+class StageProfiler(object):
+  def __init__(self, cprofile=False):
+    self.cprofile = cprofile
+    self.start_usage = get_usage()
+    self.stages = []
+    self.current = None
+    self.profile = None
+    self.slowest_profile = None
+    self.slowest_seconds = -1
+
+  def start(self, name):
+    self.stop()
+    self.current = {"stage":name, "usage":get_usage(), "counts":{}}
+    if self.cprofile:
+      self.profile = cProfile.Profile()
+      self.profile.enable()
+
+  def set_count(self, name, value):
+    if self.current != None:
+      self.current["counts"][name] = value
+
+  def stop(self):
+    if self.current == None:
+      return
+    if self.profile != None:
+      self.profile.disable()
+
+    wall, cpu, rss_kb, children_rss_kb = get_usage()
+    start_wall, start_cpu, _, _ = self.current["usage"]
+    stage = {
+      "stage":self.current["stage"],
+      "wall_seconds":round(wall - start_wall, 4),
+      "cpu_seconds":round(cpu - start_cpu, 4),
+      "peak_rss_mb":round(rss_kb / 1024, 1),
+      "children_peak_rss_mb":round(children_rss_kb / 1024, 1),
+      "counts":self.current["counts"]
+    }
+    self.stages.append(stage)
+
+    if self.profile != None and stage["wall_seconds"] > self.slowest_seconds:
+      self.slowest_profile = (stage["stage"], self.profile)
+      self.slowest_seconds = stage["wall_seconds"]
+    self.profile = None
+    self.current = None
+
+  def summary(self):
+    wall, cpu, rss_kb, children_rss_kb = get_usage()
+    return({
+      "wall_seconds":round(wall - self.start_usage[0], 4),
+      "cpu_seconds":round(cpu - self.start_usage[1], 4),
+      "peak_rss_mb":round(rss_kb / 1024, 1),
+      "children_peak_rss_mb":round(children_rss_kb / 1024, 1),
+    })
+
+  # write prefix.profile.json, and the cProfile stats of the slowest stage to prefix.profile.<stage>.prof
+  def save(self, prefix):
+    self.stop()
+    result = {"total":self.summary(), "stages":self.stages}
+    if self.slowest_profile != None:
+      stage_name, profile = self.slowest_profile
+      profile_file = prefix + ".profile." + "".join(c if c.isalnum() or c in "-_" else "_" for c in stage_name) + ".prof"
+      profile.dump_stats(profile_file)
+      result["cprofile"] = {"stage":stage_name, "file":profile_file}
+
+    profile_json = prefix + ".profile.json"
+    with open(profile_json, "wt") as fout:
+      json.dump(result, fout, indent=2)
+    return(profile_json)
@@ -0,0 +1,32 @@
+# Intern names to dense integer ids. The id of a name is the order it was first interned.
+class SymbolTable(object):
+  __slots__ = "names", "ids"
+
+  def __init__(self, names=[]):
+    self.names = []
+    self.ids = {}
+    for name in names:
+      self.intern(name)
+
+  def intern(self, name):
+    result = self.ids.get(name)
+    if result == None:
+      result = len(self.names)
+      self.ids[name] = result
+      self.names.append(name)
+    return(result)
+
+  def get_id(self, name):
+    return(self.ids[name])
+
+  def get_name(self, id):
+    return(self.names[id])
+
+  def get_names(self, ids):
+    return([self.names[id] for id in ids])
+
+  def __len__(self):
+    return(len(self.names))
+
+  def __contains__(self, name):
+    return(name in self.ids)
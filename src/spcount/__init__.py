@@ -2,6 +2,22 @@ name = "spcount"
 
 from .__version__ import __version__
 
-from .database_util import prepare_index
-from .bowtie_util import bowtie, bowtie_fastq2fasta
-from .count_util import count
+# functions are imported on first access, so importing spcount doesn't load numpy/pandas
+LAZY_FUNCTIONS = {
+  "prepare_index": ".database_util",
+  "bowtie": ".bowtie_util",
+  "bowtie_fastq2fasta": ".bowtie_util",
+  "bowtie_batch": ".bowtie_util",
+  "bowtie_collapsed": ".bowtie_util",
+  "count": ".count_util",
+}
+
+def __getattr__(attr):
+  module = LAZY_FUNCTIONS.get(attr)
+  if module == None:
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
+  from importlib import import_module
+  return(getattr(import_module(module, __name__), attr))
+
+def __dir__():
+  return(sorted(list(globals().keys()) + list(LAZY_FUNCTIONS.keys())))
@@ -5,11 +5,9 @@ import os
 from datetime import datetime
 
 from .__version__ import __version__
-from .taxonomy_util import prepare_taxonomy
-from .database_util import download_assembly_summary, prepare_segment_database, prepare_index, fastq_to_database
-from .bowtie_util import bowtie, bowtie_fastq2fasta
-from .count_util import bowtie_count, count_table
-from .visualization_util import krona
+from .compress_util import BACKENDS, set_compression
+
+# modules of subcommands are imported in their own branch, so each subcommand only loads the libraries it uses.
 
 def initialize_logger(logfile, args):
   logger = logging.getLogger('spcount')
@@ -39,6 +37,9 @@ def runCommand(command, logger):
 def main():
   parser = argparse.ArgumentParser(description="spcount " + __version__,
                                    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('--gzip_backend', action='store', choices=BACKENDS, help="Backend to read/write gzip files (default auto)")
+  parser.add_argument('--gzip_level', action='store', type=int, help="Compression level (1-9) of gzip output (default 6)")
+  parser.add_argument('--gzip_threads', action='store', type=int, help="Number of threads to write gzip output (default 1)")
 
   
   DEBUG = False
@@ -49,14 +50,19 @@ def main():
   
   subparsers = parser.add_subparsers(dest="command")
 
-  parser_t = subparsers.add_parser('dl_taxonomy')
+  # options shared by all subcommands
+  profile_parser = argparse.ArgumentParser(add_help=False)
+  profile_parser.add_argument('--profile', action='store_true', help="Save wall time, cpu time, peak memory and item counts of stages to <output>.profile.json")
+  profile_parser.add_argument('--cprofile', action='store_true', help="With --profile, also save cProfile stats of the slowest stage to <output>.profile.<stage>.prof")
+
+  parser_t = subparsers.add_parser('dl_taxonomy', parents=[profile_parser])
   parser_t.add_argument('-o', '--output', action='store', nargs='?', help="Output file", required=NOT_DEBUG)
 
-  parser_s = subparsers.add_parser('dl_assembly_summary')
+  parser_s = subparsers.add_parser('dl_assembly_summary', parents=[profile_parser])
   parser_s.add_argument('-d', '--database', action='store', default="genbank", help='Input database (genbank or refseq, default is genbank database)')
   parser_s.add_argument('-o', '--output', action='store', nargs='?', help="Output file", required=NOT_DEBUG)
 
-  parser_segment = subparsers.add_parser('dl_genome')
+  parser_segment = subparsers.add_parser('dl_genome', parents=[profile_parser])
   parser_segment.add_argument('-i', '--taxonomy_id', action='store', type=int, default=2, nargs='?', required=NOT_DEBUG, help='Input taxonomy id (for example, 2 for bacteria)')
   parser_segment.add_argument('-t', '--taxonomy_file', action='store', nargs='?', required=NOT_DEBUG, help='Input taxonomy file')
   parser_segment.add_argument('-a', '--assembly_summary_file', action='store', nargs='?', required=NOT_DEBUG, help='Input assembly summary file')
@@ -66,20 +72,36 @@ def main():
   parser_segment.add_argument('-o', '--output_folder', action='store', nargs='?', required=NOT_DEBUG, help="Output folder")
 
   # create the parser for the "index" command
-  parser_index = subparsers.add_parser('bowtie_index')
+  parser_index = subparsers.add_parser('bowtie_index', parents=[profile_parser])
   parser_index.add_argument('-i', '--input', action='store', nargs='?', help='Input database list file', required=NOT_DEBUG)
   parser_index.add_argument('-t', '--thread', action='store', type=int, default=8, nargs='?', help="Thread number")
   parser_index.add_argument('-f', '--force', action='store_true', default=False, help="Ignore existing index file and regenerate all")
   parser_index.add_argument('-s', '--slurm_template', action='store', default=False, help="Input slurm template")
 
-  parser_count = subparsers.add_parser('bowtie_count')
+  parser_batch = subparsers.add_parser('bowtie_batch', parents=[profile_parser])
+  parser_batch.add_argument('-i', '--input', action='store', nargs='?', help='Input sample list file, fastq/fasta file and sample name in each line', required=NOT_DEBUG)
+  parser_batch.add_argument('-d', '--database', action='store', nargs='?', help='Input database list file', required=NOT_DEBUG)
+  parser_batch.add_argument('-t', '--thread', action='store', type=int, default=8, nargs='?', help="Thread number")
+  parser_batch.add_argument('--category_jobs', action='store', type=int, default=1, help="Number of categories mapped at the same time, thread is split between them")
+  parser_batch.add_argument('-o', '--output_prefix', action='store', nargs='?', help="Output prefix, bowtie result of each sample is <output_prefix>.<sample>.bowtie.txt", required=NOT_DEBUG)
+
+  parser_collapsed = subparsers.add_parser('bowtie_collapsed', parents=[profile_parser])
+  parser_collapsed.add_argument('-i', '--input', action='store', nargs='?', help='Input fastq file', required=NOT_DEBUG)
+  parser_collapsed.add_argument('-d', '--database', action='store', nargs='?', help='Input database list file', required=NOT_DEBUG)
+  parser_collapsed.add_argument('-t', '--thread', action='store', type=int, default=8, nargs='?', help="Thread number")
+  parser_collapsed.add_argument('--category_jobs', action='store', type=int, default=1, help="Number of categories mapped at the same time, thread is split between them")
+  parser_collapsed.add_argument('-o', '--output', action='store', nargs='?', help="Output bowtie result file, count of unique sequences is written to <output>.dupcount", required=NOT_DEBUG)
+
+  parser_count = subparsers.add_parser('bowtie_count', parents=[profile_parser])
   parser_count.add_argument('-i', '--input', action='store', nargs='?', help='Input BAM list file', required=NOT_DEBUG)
   parser_count.add_argument('-c', '--count', action='store', nargs='?', help='Input count file', required=NOT_DEBUG)
   parser_count.add_argument('-s', '--species', action='store', nargs='?', help='Input species file', required=NOT_DEBUG)
   parser_count.add_argument('-t', '--species_column', action='store', default="species", nargs='?', help='Input species column')
   parser_count.add_argument('-o', '--output', action='store', nargs='?', help="Output summary file", required=NOT_DEBUG)
+  parser_count.add_argument('--threads', action='store', type=int, default=1, help="Number of processes to parse bowtie files")
+  parser_count.add_argument('--output_format', action='store', choices=['txt', 'npz'], default='txt', help="Output gzipped text or binary npz which can be used by count_table directly (default txt)")
 
-  parser_table = subparsers.add_parser('count_table')
+  parser_table = subparsers.add_parser('count_table', parents=[profile_parser])
   parser_table.add_argument('-i', '--input', action='store', nargs='?', help='Input count list file', required=NOT_DEBUG)
   parser_table.add_argument('-t', '--taxonomy_file', action='store', nargs='?', required=NOT_DEBUG, help='Input taxonomy file')
   parser_table.add_argument('-s', '--species', action='store', nargs='?', help='Input species file', required=NOT_DEBUG)
@@ -87,8 +109,12 @@ def main():
   parser_table.add_argument('-a', '--aggregate_rate', action='store', type=float, default=0.95, help='Input aggregate rate (default 0.95)')
   parser_table.add_argument('-o', '--output_prefix', action='store', nargs='?', help="Output prefix", required=NOT_DEBUG)
   parser_table.add_argument('-d', '--debug_mode', action='store_true', help="Debug mode")
+  parser_table.add_argument('--threads', action='store', type=int, default=1, help="Number of processes to parse samples")
+  parser_table.add_argument('--resume', action='store_true', help="Save checkpoints of stages in output folder and resume from them when rerun with same inputs")
+  parser_table.add_argument('--cache_dir', action='store', help="Folder to cache parsed samples, only new or changed samples are parsed in next run")
+  parser_table.add_argument('--read_memory_mb', action='store', type=float, default=0, help="Memory budget (MB) to build read count table by external sort, 0 to build in memory (default 0)")
 
-  parser_krona = subparsers.add_parser('krona')
+  parser_krona = subparsers.add_parser('krona', parents=[profile_parser])
   parser_krona.add_argument('-i', '--input', action='store', nargs='?', help='Input tree count file', required=NOT_DEBUG)
   parser_krona.add_argument('-g', '--group_file', action='store', nargs='?', required=NOT_DEBUG, help='Input group file')
   parser_krona.add_argument('-t', '--taxonomy_folder', action='store', nargs='?', required=NOT_DEBUG, help='Path to directory containing a Krona taxonomy database (taxonomy.tab) to use.')
@@ -127,39 +153,88 @@ def main():
     sys.exit(1)
 
   args = parser.parse_args()
+  set_compression(args.gzip_backend, args.gzip_level, args.gzip_threads)
   #args.command = "database"
+
+  profiler = None
+  if getattr(args, "profile", False):
+    from .StageProfiler import StageProfiler
+    profiler = StageProfiler(cprofile=args.cprofile)
+    # the whole command is a stage unless the command records its own stages
+    profiler.start(args.command)
+  # prefix of profile files, same as log file of each command
+  profile_prefix = None
   
   if args.command == "dl_taxonomy":
     logger = initialize_logger(args.output + ".log", args)
+    profile_prefix = args.output
     print(args)
+    from .taxonomy_util import prepare_taxonomy
     prepare_taxonomy(logger, args.output)
   elif args.command == "dl_assembly_summary":
     logger = initialize_logger(args.output + ".log", args)
+    profile_prefix = args.output
     print(args)
+    from .database_util import download_assembly_summary
     download_assembly_summary(logger, args.output, args.database)
   elif args.command == "dl_genome":
     logger = initialize_logger(os.path.join(args.output_folder, args.prefix + ".log"), args)
+    profile_prefix = os.path.join(args.output_folder, args.prefix)
     print(args)
-    prepare_segment_database(logger, args.taxonomy_file, args.assembly_summary_file, args.taxonomy_id, args.output_folder, args.prefix, args.maximum_genome_in_file, args.reference_representative_only)
+    from .database_util import prepare_segment_database
+    prepare_segment_database(logger, args.taxonomy_file, args.assembly_summary_file, args.taxonomy_id, args.output_folder, args.prefix, args.maximum_genome_in_file, args.reference_representative_only, profiler)
   elif args.command == "bowtie_index":
     if DEBUG:
       args.input = "/scratch/cqs_share/references/refseq/bacteria/20200321_assembly_summary.txt.files.list"
       args.thread = 8
     logger = initialize_logger(args.input + ".log", args)
+    profile_prefix = args.input
     print(args)
+    from .database_util import prepare_index
     prepare_index(logger, args.input, args.thread, args.force, args.slurm_template)
+  elif args.command == 'bowtie_batch':
+    logger = initialize_logger(args.output_prefix + ".log", args)
+    profile_prefix = args.output_prefix
+    print(args)
+    from .bowtie_util import bowtie_batch
+    bowtie_batch(logger, 
+                 sampleListFile = args.input, 
+                 outputPrefix = args.output_prefix,
+                 databaseListFile = args.database,
+                 thread = args.thread,
+                 profiler = profiler,
+                 categoryJobs = args.category_jobs)
+  elif args.command == 'bowtie_collapsed':
+    logger = initialize_logger(args.output + ".spcount.log", args)
+    profile_prefix = args.output
+    print(args)
+    from .bowtie_util import bowtie_collapsed
+    bowtie_collapsed(logger, 
+                     inputFile = args.input, 
+                     outputFile = args.output,
+                     databaseListFile = args.database,
+                     thread = args.thread,
+                     profiler = profiler,
+                     categoryJobs = args.category_jobs)
   elif args.command == 'bowtie_count':
     logger = initialize_logger(args.output + ".log", args)
+    profile_prefix = args.output
     print(args)
+    from .count_util import bowtie_count
     bowtie_count(logger, 
                  input_list_file = args.input, 
                  output_file = args.output,
                  count_file = args.count, 
                  species_file = args.species, 
-                 species_column = args.species_column)
+                 species_column = args.species_column,
+                 threads = args.threads,
+                 output_format = args.output_format,
+                 profiler = profiler)
   elif args.command == 'count_table':
     logger = initialize_logger(args.output_prefix + ".log", args)
+    profile_prefix = args.output_prefix
     print(args)
+    from .count_util import count_table
     count_table(logger, 
                 input_list_file = args.input, 
                 output_prefix = args.output_prefix,
@@ -167,10 +242,17 @@ def main():
                 species_file = args.species, 
                 species_column = args.species_column,
                 aggregate_rate = args.aggregate_rate,
-                debug_mode = args.debug_mode)
+                debug_mode = args.debug_mode,
+                threads = args.threads,
+                read_memory_mb = args.read_memory_mb,
+                cache_dir = args.cache_dir,
+                resume = args.resume,
+                profiler = profiler)
   elif args.command == "krona":
     logger = initialize_logger(args.output_prefix + ".log", args)
+    profile_prefix = args.output_prefix
     print(args)
+    from .visualization_util import krona
     krona(logger, 
       treeFile = args.input, 
       groupFile = args.group_file, 
@@ -186,6 +268,7 @@ def main():
 
     logger = initialize_logger(args.output + ".log", args)
     print(args)
+    from .database_util import fastq_to_database
     fastq_to_database(logger, args.input, args.sample_name, args.output, args.reads_per_file)
   elif args.command == "bowtie":
     if DEBUG:
@@ -194,12 +277,15 @@ def main():
       args.thread = 32
       args.output = "/scratch/cqs/kasey_vickers_projects/testdata/VLDL_WZ.txt"
     print(args)
+    from .bowtie_util import bowtie, bowtie_fastq2fasta
     if args.fastq2fasta:
       logger = initialize_logger(args.outputPrefix + ".log", args)
-      bowtie_fastq2fasta(logger, args.input, args.outputPrefix, args.databaseListFile, args.thread)
+      profile_prefix = args.outputPrefix
+      bowtie_fastq2fasta(logger, args.input, args.outputPrefix, args.databaseListFile, args.thread, profiler=profiler)
     else:
       logger = initialize_logger(args.output + ".spcount.log", args)
-      bowtie(logger, args.input, args.output, args.databaseListFile, args.thread)
+      profile_prefix = args.output
+      bowtie(logger, args.input, args.output, args.databaseListFile, args.thread, profiler=profiler)
   elif args.command == "count":
     if DEBUG:
       args.input = "/scratch/cqs/kasey_vickers_projects/testdata/VLDL_WZ_bacteria.txt"
@@ -207,10 +293,15 @@ def main():
       args.output = "/scratch/cqs/kasey_vickers_projects/testdata/VLDL_WZ_bacteria.count"
     print(args)
     logger = initialize_logger(args.output + ".log", args)
+    profile_prefix = args.output
+    from .count_util import count
     count(logger, args.input, args.output, args.countFile, args.category_name)
   elif args.command == "sequential_count":
     logger = initialize_logger(args.output + ".log", args)
     #sequential_count(logger, args.input, args.dbFile, args.output, args.countFile)
+
+  if profiler != None and profile_prefix != None:
+    logger.info(f"profile saved to {profiler.save(profile_prefix)}")
   
 if __name__ == "__main__":
   main()
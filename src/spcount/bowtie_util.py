@@ -2,15 +2,62 @@ import argparse
 import sys
 import logging
 import os
-import gzip
 import math
+import shutil
 import subprocess
 from _ctypes import ArgumentError
+from concurrent.futures import ThreadPoolExecutor
 
 from .BowtieIndex import BowtieIndexItem, readBowtieIndexList
+from .common_util import readFileMap
+from .compress_util import open_compressed
+from .fastq_util import collapse_fastq_to_fasta
+from .StageProfiler import StageProfiler
 
-def bowtie(logger, inputFile, outputFile, databaseListFile, thread, isFasta=False):
+# Map the input to indecies of one category in a chain: reads unmapped to an index are mapped to the next index.
+# Alignments are read from the stdout pipe of bowtie and written to categoryFile with category as they arrive, bowtie
+# messages are written to categoryLogFile. Return number of alignments.
+def bowtie_category(logger, category, bowtieIndecies, inputFile, categoryPrefix, categoryFile, categoryLogFile, thread, isFasta):
+  logger.info("Searching category %s by %d threads ..." % (category, thread))
+  alignmentCount = 0
+  with open(categoryFile, "wt") as fout, open(categoryLogFile, "wt") as flog:
+    bowtieCount = 0
+
+    inputFastq = inputFile
+    for bowtieIndex in bowtieIndecies:
+      bowtieCount = bowtieCount + 1
+      logger.info("  Searching %s to %s ..." % (category, bowtieIndex))
+
+      if isFasta:
+        unmapped = "%s.%d.unmapped.fasta" % (categoryPrefix, bowtieCount)
+        command = ['bowtie', '-f', '-k', '1', '-v', '0', '-p', str(thread), '--no-unal', '--un', unmapped, bowtieIndex, inputFastq]
+      else:
+        unmapped = "%s.%d.unmapped.fastq" % (categoryPrefix, bowtieCount)
+        command = ['bowtie', '-k', '1', '-v', '0', '-p', str(thread), '--no-unal', '--un', unmapped, bowtieIndex, inputFastq]
+
+      with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=flog, text=True) as proc:
+        for line in proc.stdout:
+          parts = line.rstrip().split('\t')
+          fout.write("%s\t%s\t%s\t%s\t%s\n" % (parts[0].split(' ')[0], parts[1], parts[2], parts[3], category))
+          alignmentCount += 1
+      if proc.returncode != 0:
+        raise Exception("bowtie failed on index %s with exit code %d: %s" % (bowtieIndex, proc.returncode, " ".join(command)))
+      
+      if bowtieCount > 1:
+        os.remove(inputFastq)
+      inputFastq = unmapped
+    
+    if inputFastq != inputFile:
+      os.remove(inputFastq)
+  return(alignmentCount)
+
+# Categories are independent since each chain starts from inputFile, so up to categoryJobs chains are run at once and
+# thread is split between them. Results are merged in category name order, same as running one by one.
+def bowtie(logger, inputFile, outputFile, databaseListFile, thread, isFasta=False, profiler=None, categoryJobs=1):
   logger.info("Start bowtie ...")
+  if profiler == None:
+    profiler = StageProfiler()
+
   bowtieIndexList = readBowtieIndexList(databaseListFile)
 
   for bowtieIndex in bowtieIndexList:
@@ -18,61 +65,56 @@ def bowtie(logger, inputFile, outputFile, databaseListFile, thread, isFasta=Fals
       raise ArgumentError("Bowtie index not exists: %s" % bowtieIndex.Index)
 
   categories = sorted(set([bi.Category for bi in bowtieIndexList])) 
+  jobs = max(1, min(categoryJobs, len(categories)))
+  jobThread = max(1, thread // jobs)
+
+  profiler.start("bowtie")
+  profiler.set_count("categories", len(categories))
+  profiler.set_count("indexes", len(bowtieIndexList))
+  categoryFiles = []
+  with ThreadPoolExecutor(max_workers=jobs) as executor:
+    futures = []
+    for categoryIndex, category in enumerate(categories):
+      bowtieIndecies = [bi.Index for bi in bowtieIndexList if bi.Category == category]
+      categoryPrefix = "%s.c%d" % (outputFile, categoryIndex)
+      categoryFiles.append((category, categoryPrefix + ".tmp", categoryPrefix + ".log"))
+      futures.append(executor.submit(bowtie_category, logger, category, bowtieIndecies, inputFile, categoryPrefix, categoryPrefix + ".tmp", categoryPrefix + ".log", jobThread, isFasta))
+    alignmentCount = sum(future.result() for future in futures)
+  profiler.set_count("alignments", alignmentCount)
+
+  profiler.start("merge")
   logfile = outputFile + ".log"
   tmpFile = outputFile + ".tmp"
   with open(tmpFile, "wt") as fout:
     with open(logfile, "wt") as flog:
-      for category in categories:
-        logger.info("Searching category %s ..." % category)
+      for category, categoryFile, categoryLogFile in categoryFiles:
         flog.write(">" + category + "\n")
-        flog.flush()
-        bowtieIndecies = [bi.Index for bi in bowtieIndexList if bi.Category == category]
-
-        bowtieCount = 0
-
-        inputFastq = inputFile
-        for bowtieIndex in bowtieIndecies:
-          bowtieCount = bowtieCount + 1
-          logger.info("  Searching to %s ..." % bowtieIndex)
-          outfile = "%s.%d.out" % (outputFile, bowtieCount)
-
-          if isFasta:
-            unmapped = "%s.%d.unmapped.fasta" % (outputFile, bowtieCount)
-            subprocess.call(['bowtie', '-f', '-k', '1', '-v', '0', '-p', str(thread), '--no-unal', '--un', unmapped, bowtieIndex, inputFastq, outfile], 
-              stderr=flog)
-          else:
-            unmapped = "%s.%d.unmapped.fastq" % (outputFile, bowtieCount)
-            subprocess.call(['bowtie', '-k', '1', '-v', '0', '-p', str(thread), '--no-unal', '--un', unmapped, bowtieIndex, inputFastq, outfile], 
-              stderr=flog)
-
-          with open(outfile, "rt") as fin:
-            for line in fin:
-              parts = line.rstrip().split('\t')
-              fout.write("%s\t%s\t%s\t%s\t%s\n" % (parts[0].split(' ')[0], parts[1], parts[2], parts[3], category))
-          #break
-          os.remove(outfile)
-          
-          if bowtieCount > 1:
-            os.remove(inputFastq)
-          inputFastq = unmapped
-        
-        if inputFastq != inputFile:
-          os.remove(inputFastq)
+        with open(categoryLogFile, "rt") as fin:
+          shutil.copyfileobj(fin, flog)
+        with open(categoryFile, "rt") as fin:
+          shutil.copyfileobj(fin, fout)
+        os.remove(categoryLogFile)
+        os.remove(categoryFile)
+  profiler.stop()
   
   os.rename(tmpFile, outputFile)
 
   logger.info("done")
 
-def bowtie_fastq2fasta(logger, inputFile, outputFile, databaseListFile, thread):
+def bowtie_fastq2fasta(logger, inputFile, outputFile, databaseListFile, thread, profiler=None, categoryJobs=1):
   logger.info("Start bowtie_fastq2fasta ...")
+  if profiler == None:
+    profiler = StageProfiler()
   bowtieIndexList = readBowtieIndexList(databaseListFile)
 
   for bowtieIndex in bowtieIndexList:
     if not os.path.exists(bowtieIndex.Index + ".rev.2.ebwt") and not os.path.exists(bowtieIndex.Index + ".rev.2.ebwtl") :
       raise ArgumentError("Bowtie index not exists: %s" % bowtieIndex.Index)
 
+  profiler.start("fastq2fasta")
+  readCount = 0
   inputFasta = outputFile + ".fasta"
-  fin = gzip.open(inputFile, "rt") if inputFile.endswith(".gz") else open(inputFile, "rt")
+  fin = open_compressed(inputFile, "rt") if inputFile.endswith(".gz") else open(inputFile, "rt")
   with fin:
     with open(inputFasta, "wt") as fout:
       while True:
@@ -84,9 +126,96 @@ def bowtie_fastq2fasta(logger, inputFile, outputFile, databaseListFile, thread):
         fin.readline()
         queryName = query.rstrip().split('\t')[0].split(' ')[0]
         fout.write(">%s\n%s\n" %(queryName[1:], sequence))
+        readCount += 1
+  profiler.set_count("reads", readCount)
   
-  bowtie(logger, inputFasta, outputFile, databaseListFile, thread, True)
+  bowtie(logger, inputFasta, outputFile, databaseListFile, thread, True, profiler, categoryJobs)
   
+# Map each unique sequence of fastq once: the fastq is collapsed while it is converted to fasta, and the count of each
+# unique sequence is written to <outputFile>.dupcount, which is used by bowtie_count to apply the counts to the mapped reads.
+def bowtie_collapsed(logger, inputFile, outputFile, databaseListFile, thread, profiler=None, categoryJobs=1):
+  logger.info("Start bowtie_collapsed ...")
+  if profiler == None:
+    profiler = StageProfiler()
+
+  profiler.start("collapse")
+  inputFasta = outputFile + ".fasta"
+  readCount, uniqueCount = collapse_fastq_to_fasta(logger, inputFile, inputFasta, outputFile + ".dupcount")
+  logger.info("%d reads collapsed to %d unique sequences" % (readCount, uniqueCount))
+  profiler.set_count("reads", readCount)
+  profiler.set_count("unique_reads", uniqueCount)
+
+  bowtie(logger, inputFasta, outputFile, databaseListFile, thread, True, profiler, categoryJobs)
+  os.remove(inputFasta)
+
+# Read names in batch input are tagged by sample index, "<sample index>|<read name>"
+SAMPLE_TAG_SEPARATOR = "|"
+
+# Append reads of fasta/fastq file to fout as fasta with tagged read names, return number of reads.
+def write_tagged_fasta(fout, inputFile, sampleIndex):
+  readCount = 0
+  with open_compressed(inputFile, "rt") if inputFile.endswith(".gz") else open(inputFile, "rt") as fin:
+    while True:
+      query = fin.readline()
+      if not query:
+        break
+      sequence = fin.readline().rstrip()
+      if query.startswith("@"):
+        fin.readline()
+        fin.readline()
+      queryName = query.rstrip().split('\t')[0].split(' ')[0]
+      fout.write(">%d%s%s\n%s\n" % (sampleIndex, SAMPLE_TAG_SEPARATOR, queryName[1:], sequence))
+      readCount += 1
+  return(readCount)
+
+# Map reads of all samples in sampleListFile (file and sample name in each line) in one batch, so each index is loaded
+# once instead of once per sample. Reads of samples are merged into one fasta with read names tagged by sample, mapped
+# by bowtie, and the alignments are demultiplexed into <outputPrefix>.<sample>.bowtie.txt, which can be used by
+# bowtie_count. The output files and samples are listed in <outputPrefix>.list.
+def bowtie_batch(logger, sampleListFile, outputPrefix, databaseListFile, thread, profiler=None, categoryJobs=1):
+  logger.info("Start bowtie_batch ...")
+  if profiler == None:
+    profiler = StageProfiler()
+
+  sampleFileMap = readFileMap(sampleListFile)
+  samples = list(sampleFileMap.keys())
+
+  profiler.start("merge_samples")
+  readCount = 0
+  inputFasta = outputPrefix + ".batch.fasta"
+  with open(inputFasta, "wt") as fout:
+    for sampleIndex, sample in enumerate(samples):
+      logger.info("Reading %s of %s ..." % (sampleFileMap[sample], sample))
+      readCount += write_tagged_fasta(fout, sampleFileMap[sample], sampleIndex)
+  profiler.set_count("samples", len(samples))
+  profiler.set_count("reads", readCount)
+
+  batchFile = outputPrefix + ".batch.txt"
+  bowtie(logger, inputFasta, batchFile, databaseListFile, thread, True, profiler, categoryJobs)
+  os.remove(inputFasta)
+
+  profiler.start("demultiplex")
+  logger.info("Demultiplexing %s to %d samples ..." % (batchFile, len(samples)))
+  sampleFiles = ["%s.%s.bowtie.txt" % (outputPrefix, sample) for sample in samples]
+  fouts = [open(sampleFile, "wt") for sampleFile in sampleFiles]
+  try:
+    with open(batchFile, "rt") as fin:
+      for line in fin:
+        tag, alignment = line.split(SAMPLE_TAG_SEPARATOR, 1)
+        fouts[int(tag)].write(alignment)
+  finally:
+    for fout in fouts:
+      fout.close()
+  os.remove(batchFile)
+  os.rename(batchFile + ".log", outputPrefix + ".bowtie.log")
+
+  with open(outputPrefix + ".list", "wt") as fout:
+    for sample, sampleFile in zip(samples, sampleFiles):
+      fout.write("%s\t%s\n" % (sampleFile, sample))
+  profiler.stop()
+
+  logger.info("done")
+
 if __name__ == "__main__":
   logger = logging.getLogger('sequenceBowtie')
   logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)-8s - %(message)s')
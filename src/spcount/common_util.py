@@ -1,3 +1,5 @@
+import multiprocessing
+
 def readFileMap(fileName):
   result = {}
   with open(fileName, "rt") as fin:
@@ -6,3 +8,13 @@ def readFileMap(fileName):
       parts = line.rstrip().split('\t')
       result[parts[1]] = parts[0]
   return(result)
+
+# map func to items in order, by a process pool if threads > 1
+def map_in_order(func, items, threads=1):
+  if threads > 1 and len(items) > 1:
+    with multiprocessing.Pool(min(threads, len(items))) as pool:
+      for result in pool.imap(func, items):
+        yield result
+  else:
+    for item in items:
+      yield func(item)
@@ -0,0 +1,134 @@
+import gzip
+import io
+import os
+import shutil
+import signal
+import subprocess
+
+try:
+  from isal import igzip as isal_gzip
+except ImportError:
+  isal_gzip = None
+
+try:
+  from isal import igzip_threaded as isal_gzip_threaded
+except ImportError:
+  isal_gzip_threaded = None
+
+BACKENDS = ['auto', 'isal', 'igzip', 'pigz', 'gzip']
+
+# isa-l is preferred for both reading and writing, writing by multiple threads prefers pigz
+PREFERENCE = ['isal', 'igzip', 'pigz', 'gzip']
+THREADED_WRITE_PREFERENCE = ['pigz', 'isal', 'igzip', 'gzip']
+
+# Settings are kept in environment, so they are also used by child processes of process pools.
+def get_compression_settings():
+  return({
+    'backend': os.environ.get('SPCOUNT_GZIP_BACKEND', 'auto'),
+    'level': int(os.environ.get('SPCOUNT_GZIP_LEVEL', '6')),
+    'threads': int(os.environ.get('SPCOUNT_GZIP_THREADS', '1')),
+  })
+
+def set_compression(backend=None, level=None, threads=None):
+  if backend != None:
+    if backend not in BACKENDS:
+      raise Exception(f"Unknown gzip backend {backend}, should be one of {BACKENDS}")
+    os.environ['SPCOUNT_GZIP_BACKEND'] = backend
+  if level != None:
+    os.environ['SPCOUNT_GZIP_LEVEL'] = str(level)
+  if threads != None:
+    os.environ['SPCOUNT_GZIP_THREADS'] = str(threads)
+
+def get_available_backends():
+  result = []
+  if isal_gzip != None:
+    result.append('isal')
+  for command in ['igzip', 'pigz']:
+    if shutil.which(command) != None:
+      result.append(command)
+  result.append('gzip')
+  return(result)
+
+def choose_backend(writing, threads):
+  available = get_available_backends()
+  preference = THREADED_WRITE_PREFERENCE if writing and threads > 1 else PREFERENCE
+  return([backend for backend in preference if backend in available][0])
+
+# isa-l supports compression level 0 to 3 only
+def get_isal_level(level):
+  return(min(3, (level + 2) // 3))
+
+# File object of pigz/igzip process. The exit code is checked when it is closed, a reader closed before end of
+# stream is allowed to be killed by SIGPIPE.
+class ProcessFile(object):
+  def __init__(self, filename, mode, command):
+    self.filename = filename
+    self.command = command
+    self.writing = 'w' in mode or 'a' in mode
+    if self.writing:
+      self.output = open(filename, 'ab' if 'a' in mode else 'wb')
+      self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self.output)
+      stream = self.process.stdin
+    else:
+      self.output = None
+      self.process = subprocess.Popen(command + [filename], stdout=subprocess.PIPE)
+      stream = self.process.stdout
+    self.file = io.TextIOWrapper(stream) if 't' in mode else stream
+
+  def __getattr__(self, name):
+    return(getattr(self.file, name))
+
+  def __iter__(self):
+    return(iter(self.file))
+
+  def __enter__(self):
+    return(self)
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    if self.process == None:
+      return
+    self.file.close()
+    returncode = self.process.wait()
+    if self.output != None:
+      self.output.close()
+    self.process = None
+    if returncode != 0 and not (returncode == -signal.SIGPIPE and not self.writing):
+      raise Exception(f"{' '.join(self.command)} failed on {self.filename} with exit code {returncode}")
+
+# Open gzip file by the fastest available backend: isal module, igzip or pigz process, or stdlib gzip.
+# Mode follows gzip.open, level (1-9) and threads are used for output only. Settings from set_compression are used if not set.
+def open_compressed(filename, mode='rt', level=None, threads=None, backend=None):
+  settings = get_compression_settings()
+  level = settings['level'] if level == None else level
+  threads = settings['threads'] if threads == None else threads
+  backend = settings['backend'] if backend == None else backend
+
+  writing = 'w' in mode or 'a' in mode
+  if backend == 'auto':
+    backend = choose_backend(writing, threads)
+  elif backend not in get_available_backends():
+    raise Exception(f"gzip backend {backend} is not available, available backends are {get_available_backends()}")
+
+  if backend == 'isal':
+    if threads > 1 and isal_gzip_threaded != None:
+      return(isal_gzip_threaded.open(filename, mode, compresslevel=get_isal_level(level), threads=threads))
+    return(isal_gzip.open(filename, mode, compresslevel=get_isal_level(level)))
+
+  if backend == 'igzip':
+    if writing:
+      command = ['igzip', '-c', f'-{get_isal_level(level)}'] + (['-T', str(threads)] if threads > 1 else [])
+    else:
+      command = ['igzip', '-dc']
+    return(ProcessFile(filename, mode, command))
+
+  if backend == 'pigz':
+    if writing:
+      command = ['pigz', '-c', f'-{level}', '-p', str(threads)]
+    else:
+      command = ['pigz', '-dc']
+    return(ProcessFile(filename, mode, command))
+
+  return(gzip.open(filename, mode, compresslevel=level))
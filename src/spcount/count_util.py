@@ -1,17 +1,29 @@
-import gzip
+import os
 import re
-import pickle
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import OrderedDict
+import time
+import numpy as np
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 from .CategoryEntry import CategoryEntry
-from .common_util import readFileMap
+from .common_util import readFileMap, map_in_order
+from .compress_util import open_compressed
 from .BowtieCountItem import BowtieCountItem, readBowtieTextFile, getQueryMap, assignCount
 from .Species import Species
 from .Query import Query
 from .Sequence import Sequence
+from .RankAggregator import RankAggregator
+from .QueryStore import QueryStore
+from .CountMatrix import CountMatrix
+from .LevelRollup import LevelRollup
+from .SymbolTable import SymbolTable
+from .read_count_util import write_read_count_table, read_sequence_counts
+from .CountBundle import CountBundle, is_count_bundle
+from .sample_cache_util import read_sample_cached
+from .StageCheckpoint import StageCheckpoint
+from .StageProfiler import StageProfiler
 
 def removeSubset(logger, catMap):
   catItems = [v for v in catMap.values()]
@@ -56,47 +68,149 @@ def fillQueryCount(logger, queryMap, countFile):
         item.Count = count
         item.Sequence = sequence  
 
-def bowtie_count(logger, input_list_file, output_file, count_file, species_file, species_column='species'):
-  logger.info(f"reading count file {count_file}")
-  count_map={}
-  with open(count_file, "rt") as fin:
-    fin.readline()
-    for line in fin:
-      parts=line.rstrip().split('\t')
-      count_map[parts[0]] = [parts[1], parts[2]]
-
-  logger.info(f"reading species file {species_file}")
-  species_map={}
+# Species of each chromosome. Species are interned in name order, so sorted species ids are also sorted by name.
+def read_chromosome_species_map(species_file, species_column='species'):
+  chromosome_species = {}
   with open(species_file, "rt") as fin:
     line = fin.readline()
     headers = line.rstrip().split('\t')
     species_index = headers.index(species_column)
     for line in fin:
       parts = line.rstrip().split('\t')
-      species_map[parts[0]] = parts[species_index]
-
+      chromosome_species[parts[0]] = parts[species_index]
+
+  species_table = SymbolTable(sorted(set(chromosome_species.values())))
+  return(species_table, {chrom:species_table.get_id(species) for chrom, species in chromosome_species.items()})
+
+# Hit species of each read is stored as bytes of sorted species ids, the same bytes object is shared by reads through hit_sets.
+def add_read_hits(read_map, hit_sets, query, species_ids):
+  if query == None:
+    return
+  old_ids = read_map.get(query)
+  if old_ids != None:
+    species_ids.update(array('i', old_ids))
+  key = array('i', sorted(species_ids)).tobytes()
+  read_map[query] = hit_sets.setdefault(key, key)
+
+# alignments of a read are usually adjacent in bowtie output, so they are collected before being added to read_map.
+# bowtie file is gzipped, or plain text as the output of bowtie_util.
+def read_bowtie_hits(bowtie_file, chromosome_species_map, read_map, hit_sets):
+  with open_compressed(bowtie_file, "rt") if bowtie_file.endswith(".gz") else open(bowtie_file, "rt") as fin:
+    last_query = None
+    species_ids = set()
+    for bl in fin:
+      bparts = bl.split('\t')
+      query = bparts[0].split(' ')[0]
+      if query != last_query:
+        add_read_hits(read_map, hit_sets, last_query, species_ids)
+        last_query = query
+        species_ids = set()
+      species_ids.add(chromosome_species_map[bparts[2]])
+    add_read_hits(read_map, hit_sets, last_query, species_ids)
+
+# chromosome species map of bowtie parsing worker, it is set once by pool initializer
+worker_chromosome_species_map = None
+
+def init_bowtie_worker(chromosome_species_map):
+  global worker_chromosome_species_map
+  worker_chromosome_species_map = chromosome_species_map
+
+def read_bowtie_partial_hits(bowtie_file):
   read_map = {}
+  read_bowtie_hits(bowtie_file, worker_chromosome_species_map, read_map, {})
+  return(read_map)
+
+def merge_read_hits(read_map, hit_sets, partial_map):
+  for query, key in partial_map.items():
+    old_ids = read_map.get(query)
+    if old_ids == None:
+      read_map[query] = hit_sets.setdefault(key, key)
+    elif old_ids != key:
+      add_read_hits(read_map, hit_sets, query, set(array('i', key)))
+
+# Parse bowtie files by a process pool and merge partial maps in file order, so the result is same as parsing sequentially.
+# At most threads * 2 partial maps are in flight to bound the memory.
+def read_bowtie_hits_parallel(logger, bowtie_files, chromosome_species_map, read_map, hit_sets, threads):
+  with ProcessPoolExecutor(max_workers=threads, initializer=init_bowtie_worker, initargs=(chromosome_species_map,)) as executor:
+    futures = deque()
+    for idx, bowtie_file in enumerate(bowtie_files):
+      futures.append((bowtie_file, executor.submit(read_bowtie_partial_hits, bowtie_file)))
+      is_last = idx == len(bowtie_files) - 1
+      while len(futures) > 0 and (is_last or len(futures) >= threads * 2):
+        done_file, future = futures.popleft()
+        logger.info(f"merging {done_file}")
+        merge_read_hits(read_map, hit_sets, future.result())
+
+# Species are interned to integer, reads share their hit species set and only the count and sequence of mapped reads are kept.
+# Species of each read are sorted by name in output. The output is gzipped text or CountBundle (npz) by output_format.
+def bowtie_count(logger, input_list_file, output_file, count_file, species_file, species_column='species', threads=1, output_format='txt', profiler=None):
+  if profiler == None:
+    profiler = StageProfiler()
+
+  profiler.start("species")
+  logger.info(f"reading species file {species_file}")
+  species_table, chromosome_species_map = read_chromosome_species_map(species_file, species_column)
+  profiler.set_count("chromosomes", len(chromosome_species_map))
+  profiler.set_count("species", len(species_table))
+
+  bowtie_files = []
   with open(input_list_file, "rt") as fl:
     for line in fl:
       parts = re.split('\s+', line.rstrip())
-      bowtie_file = parts[0]
+      bowtie_files.append(parts[0])
+
+  profiler.start("bowtie")
+  profiler.set_count("files", len(bowtie_files))
+  read_map = {}
+  hit_sets = {}
+  if threads > 1 and len(bowtie_files) > 1:
+    logger.info(f"parsing {len(bowtie_files)} bowtie files by {threads} processes")
+    read_bowtie_hits_parallel(logger, bowtie_files, chromosome_species_map, read_map, hit_sets, threads)
+  else:
+    for bowtie_file in bowtie_files:
       logger.info(f"parsing {bowtie_file}")
-      with gzip.open(bowtie_file, "rt") as fin:
-        for bl in fin:
-          bparts = bl.split('\t')
-          query = bparts[0].split(' ')[0]
-          species = species_map[bparts[2]]
-          read_map.setdefault(query,set()).add(species)
+      read_bowtie_hits(bowtie_file, chromosome_species_map, read_map, hit_sets)
+  logger.info(f"{len(read_map)} reads mapped to {len(hit_sets)} species sets")
+  profiler.set_count("reads", len(read_map))
+  profiler.set_count("species_sets", len(hit_sets))
+  hit_sets = None
 
+  profiler.start("count")
+  logger.info(f"reading count file {count_file}")
+  count_map={}
+  with open(count_file, "rt") as fin:
+    fin.readline()
+    for line in fin:
+      parts=line.rstrip().split('\t')
+      if parts[0] in read_map:
+        count_map[parts[0]] = (int(parts[1]), parts[2])
+  profiler.set_count("reads", len(count_map))
+
+  profiler.start("output")
   logger.info(f"merge all bowtie result ...")
-  all_queries = [[query, int(count_map[query][0]), count_map[query][1], ",".join(read_map[query])] for query in read_map.keys()]   
-  all_queries.sort(key=lambda x:x[1], reverse=True)
+  all_queries = list(read_map.keys())
+  all_queries.sort(key=lambda x:count_map[x][0], reverse=True)
+  profiler.set_count("reads", len(all_queries))
 
   logger.info(f"output to {output_file} ...")
-  with gzip.open(output_file, "wt") as fout:
+  if output_format == "npz":
+    CountBundle.write(output_file,
+                      all_queries,
+                      [count_map[query][0] for query in all_queries],
+                      [count_map[query][1] for query in all_queries],
+                      species_table.names,
+                      [array('i', read_map[query]) for query in all_queries])
+    profiler.stop()
+    logger.info("done")
+    return
+
+  with open_compressed(output_file, "wt") as fout:
     fout.write("read\tcount\tsequence\tspecies\n")
     for query in all_queries:
-      fout.write(f"{query[0]}\t{query[1]}\t{query[2]}\t{query[3]}\n")
+      count, sequence = count_map[query]
+      species = ",".join(species_table.get_names(array('i', read_map[query])))
+      fout.write(f"{query}\t{count}\t{sequence}\t{species}\n")
+  profiler.stop()
 
   logger.info("done")
 
@@ -126,185 +240,153 @@ def read_file_map(input_list_file):
       file_map[parts[1]]=parts[0]
   return(file_map)
 
-def read_sequence_list(logger, file_map, debug_mode=False):
+def read_sample_sequences(logger, debug_mode, count_file):
+  if logger != None:
+    logger.info(f"parsing {count_file} for sequence ...")
+
+  seqs = []
+  counts = array('q')
+  for seq, count in read_sequence_counts(count_file, debug_mode):
+    seqs.append(seq)
+    counts.append(count)
+  return(seqs, counts)
+
+def read_sequence_list(logger, file_map, debug_mode=False, threads=1, cache_dir=None):
   sequence_map = {}
-  for sample, count_file in file_map.items():
-    if logger != None:
-      logger.info(f"parsing {count_file} for sequence ...")
-
-    with gzip.open(count_file, "rt") as fin:
-      fin.readline()
-      bcount = 0
-      for bl in fin:
-        bparts = bl.split('\t')
-        count = int(bparts[1])
-        seq = bparts[2]
-        sequence = sequence_map.get(seq)
-        if sequence == None:
-          sequence = Sequence(seq)
-          sequence_map[seq] = sequence
-        sequence.add_sample_count(sample, count)
-
-        bcount += 1
-        if debug_mode and bcount == 10000:
-          break
+  results = map_in_order(partial(read_sample_cached, cache_dir, "sequences", read_sample_sequences, logger, debug_mode), list(file_map.values()), threads)
+  for sample, (seqs, counts) in zip(file_map.keys(), results):
+    for seq, count in zip(seqs, counts):
+      sequence = sequence_map.get(seq)
+      if sequence == None:
+        sequence = Sequence(seq)
+        sequence_map[seq] = sequence
+      sequence.add_sample_count(sample, count)
   result = list(sequence_map.values())
   result.sort(key=lambda x:x.query_count, reverse=True)
   return(result)
 
+# species_list of each query should be sorted by species name already.
 def merge_queries(logger, queries):
-  logger.info("sort species_list")
-  for q in queries:
-    q.species_list.sort()
-
   logger.info("sort queries")
   queries.sort(key=lambda x:len(x.species_list), reverse=True)
 
   logger.info("merge queries")
-  for i1 in range(0, len(queries)):
-    q1 = queries[i1]
-    if q1 == None:
-      continue
-    l1 = len(q1.species_list)
-
-    for i2 in range(i1+1, len(queries)):
-      q2 = queries[i2]
-      if q2 == None:
-        continue
-
-      if l1 > len(q2.species_list):
-        break
-
-      if q1.species_list == q2.species_list:
-        q1.count += q2.count
-        queries[i2] = None
+  #the first query with the species set keeps the merged count
+  first_query_map = {}
+  result = []
+  for q in queries:
+    key = q.species_list.tobytes()
+    first_query = first_query_map.get(key)
+    if first_query == None:
+      first_query_map[key] = q
+      result.append(q)
+    else:
+      first_query.count += q.count
+  first_query_map = None
 
   logger.info(f"Before merge, queries = {len(queries)}")
-  queries = [q for q in queries if q != None]
-  logger.info(f"After merge, queries = {len(queries)}")
+  logger.info(f"After merge, queries = {len(result)}")
 
-  return(queries)
+  return(result)
 
-def read_query_list(logger, file_map, debug_mode=False):
+def read_text_queries(count_file, debug_mode):
+  species_table = SymbolTable()
+  queries = []
+  with open_compressed(count_file, "rt") as fin:
+    fin.readline()
+    bcount = 0
+    for bl in fin:
+      bparts = bl.split('\t')
+      count = int(bparts[1])
+      species_list = array('i', [species_table.intern(species) for species in sorted(bparts[3].rstrip().split(','))])
+      queries.append(Query(0, bcount, count, species_list))
+      bcount += 1
+      if debug_mode and bcount == 10000:
+        break
+  return(species_table.names, queries, bcount)
+
+# Species of each row in bundle are sorted by name already. Local species ids are assigned by first occurrence,
+# same as parsing text.
+def read_bundle_queries(count_file, debug_mode):
+  bundle = CountBundle.load(count_file)
+  row_count = bundle.get_row_count(debug_mode)
+  indptr = np.asarray(bundle.indptr[:row_count + 1])
+  indices = np.asarray(bundle.indices[:indptr[-1]])
+  used, first_index = np.unique(indices, return_index=True)
+  used = used[np.argsort(first_index)]
+  local_ids = np.zeros(len(bundle.species), dtype=np.int32)
+  local_ids[used] = np.arange(len(used), dtype=np.int32)
+  local_indices = local_ids[indices].tolist()
+
+  offsets = indptr.tolist()
+  counts = bundle.counts[:row_count].tolist()
+  queries = [Query(0, row, counts[row], array('i', local_indices[offsets[row]:offsets[row + 1]])) for row in range(row_count)]
+  return([str(name) for name in bundle.species[used]], queries, row_count)
+
+# Parse and merge queries of one sample. Species ids are local to the sample and query ids are the row indecies
+# in file. The result is returned as compact arrays: species names, number of rows, query ids, counts, number of
+# species of each query and species ids of all queries.
+def read_sample_queries(logger, debug_mode, count_file):
+  if logger != None:
+    logger.info(f"parsing {count_file} for query")
+
+  if is_count_bundle(count_file):
+    species_names, queries, row_count = read_bundle_queries(count_file, debug_mode)
+  else:
+    species_names, queries, row_count = read_text_queries(count_file, debug_mode)
+
+  queries = merge_queries(logger, queries)
+
+  query_ids = array('q', [q.name for q in queries])
+  counts = array('q', [q.count for q in queries])
+  lengths = array('i', [len(q.species_list) for q in queries])
+  species_ids = array('i')
+  for q in queries:
+    species_ids.extend(q.species_list)
+  return(species_names, row_count, query_ids, counts, lengths, species_ids)
+
+# Species names are interned to species_table and samples are interned by the order in file_map.
+# Query names are not used in output, so each query is assigned a dense integer id directly.
+# Samples are parsed by a process pool if threads > 1, the result is same as parsing sequentially.
+def read_query_list(logger, file_map, species_table, debug_mode=False, threads=1, cache_dir=None):
   query_list = []
-  for sample, count_file in file_map.items():
-    if logger != None:
-      logger.info(f"parsing {count_file} for query")
-
-    cur_list = []
-    with gzip.open(count_file, "rt") as fin:
-      fin.readline()
-      bcount = 0
-      for bl in fin:
-        bparts = bl.split('\t')
-        query_name = bparts[0].split(' ')[0]
-        count = int(bparts[1])
-        species_list = bparts[3].rstrip().split(',')
-        query = Query(sample, query_name, count, species_list)
-        cur_list.append(query)
-        bcount += 1
-        if debug_mode and bcount == 10000:
-          break
-  
-    cur_list = merge_queries(logger, cur_list)
-    query_list.extend(cur_list)
-    cur_list = None
+  query_id_offset = 0
+  results = map_in_order(partial(read_sample_cached, cache_dir, "queries", read_sample_queries, logger, debug_mode), list(file_map.values()), threads)
+  for sample_id, (species_names, row_count, query_ids, counts, lengths, species_ids) in enumerate(results):
+    global_ids = [species_table.intern(species) for species in species_names]
+    offset = 0
+    for query_id, count, length in zip(query_ids, counts, lengths):
+      species_list = array('i', [global_ids[species_id] for species_id in species_ids[offset:offset + length]])
+      offset += length
+      query_list.append(Query(sample_id, query_id_offset + query_id, count, species_list))
+    query_id_offset += row_count
 
   return(query_list)
 
-def build_species_list(query_list):
+def build_species_list(query_list, species_table):
   species_map = {}
   for query in query_list:
-    for species in query.species_list:
-      if species not in species_map:
-        species_map[species] = Species(species)
-      species_map[species].add_query(query)
+    for species_id in query.species_list:
+      species = species_map.get(species_id)
+      if species == None:
+        species = Species(species_table.get_name(species_id), id=species_id)
+        species_map[species_id] = species
+      species.add_query(query)
   result = list(species_map.values())
 
   species_map.clear()
   species_map = None
 
   for species in result:
+    species.build_queries_set()
     species.sum_query_count()
   result.sort(key=lambda x:x.query_count, reverse=True)
   return(result)
 
-# aggregate each query to unique node. The result contains nodes from different ranks.
-def build_aggregate_node_list(query_list, species_taxonomy_map, ranks, aggregate_rate):
-  agg_species_list = {}
-  for q in query_list:
-    rank, rank_name = q.get_unique_rank(species_taxonomy_map, ranks, aggregate_rate)
-    species = agg_species_list.get(rank_name)
-    if species == None:
-      species = Species(rank_name, rank)
-      agg_species_list[rank_name] = species
-    species.add_query(q)
-
-  result = list(agg_species_list.values())
-  for species in result:
-    species.sum_query_count()
-  result.sort(key=lambda x:x.query_count, reverse=True)
-  return(result)
-
-# aggregate each query to specific rank. The query doesn't aggregated to one node will be assigned to None.
-def build_aggregate_rank_list(query_list, species_taxonomy_map, rank, aggregate_rate):
-  rank_map = {}
-  for q in query_list:
-    rank_name = q.aggregate_to_rank(species_taxonomy_map, rank, aggregate_rate)
-    rank_obj = rank_map.get(rank_name)
-    if rank_obj == None:
-      rank_obj = Species(rank_name, rank)
-      rank_map[rank_name] = rank_obj
-    rank_obj.add_query(q)
-  result = list(rank_map.values())
-  for rank_obj in result:
-    rank_obj.sum_query_count()
-  result.sort(key=lambda x:x.query_count, reverse=True)
-  return(result)
-
-def output_rank_list(output_file, rank_list, samples, with_tax_id=False):
-  with open(output_file, "wt") as fout:
-    if with_tax_id:
-      fout.write("Rank_name\tTaxonomyId\tRank\t" + "\t".join(samples) + "\n")
-    else:
-      fout.write("Rank_name\tRank\t" + "\t".join(samples) + "\n")
-    for rank_obj in rank_list:
-      sample_count_str = rank_obj.get_query_count_str(samples)
-      if with_tax_id:
-        fout.write(f"{rank_obj.name}\t{rank_obj.taxid}\t{rank_obj.rank}\t{sample_count_str}\n")
-      else:
-        fout.write(f"{rank_obj.name}\t{rank_obj.rank}\t{sample_count_str}\n")
-  
-def count_table(logger, input_list_file, output_prefix, taxonomy_file, species_file, species_column='species', aggregate_rate=0.95, debug_mode=False):
-  logger.info(f"Reading taxonomy from {taxonomy_file} ...")
-  taxonomy=pd.read_csv(taxonomy_file, sep="\t")
-  taxonomy_name_id_map=dict(zip(taxonomy.ScientificName, taxonomy.Id))
-  taxonomy_name_id_map['AmbiguousRanks'] = -1
-  taxonomy_name_id_map['Unclassified'] = -1
-
-  logger.info("reading species taxonomy map from " + species_file + "...")
-  species_taxonomy_map = read_species_taxonomy_map(species_file)
-
-  file_map = read_file_map(input_list_file)
-
-  samples=list(file_map.keys())
-
-  #in order to save memory, we handle the sequence first. then in query mode, we don't need to store sequence anymore.
-  logger.info("building sequence list ...")
-  sequence_list = read_sequence_list(logger, file_map, debug_mode)
-  with open(output_prefix + ".read.count", "wt") as fout:
-    fout.write("Sequence\t" + "\t".join(samples) + "\n")
-    for sequence in sequence_list:
-      sample_count_str = sequence.get_sample_count_str(samples)
-      fout.write(f"{sequence.seq}\t{sample_count_str}\n")
-  sequence_list = None
-
-  logger.info("building query list ...")
-  query_list = read_query_list(logger, file_map, debug_mode)
-
-  logger.info("building species list from query list ...")
-  species_list = build_species_list(query_list)
-
+# species_list should be sorted by query_count descendingly.
+# A species is marked as subset if any species before it contains all of its queries.
+def mark_subset_species_legacy(logger, species_list):
+  start = time.time()
   for i1 in range(0, len(species_list)-1):
     if species_list[i1].is_subset:
       continue
@@ -315,20 +397,43 @@ def count_table(logger, input_list_file, output_prefix, taxonomy_file, species_f
         continue
       if species_list[i1].contains(species_list[i2]):
         species_list[i2].is_subset = True
+  logger.info(f"checking subset (legacy) took {time.time() - start:.2f} seconds")
+
+# Same result as mark_subset_species_legacy. Each query id is indexed to the species containing it.
+# A species can only be a subset of the species sharing its rarest query, so only those candidates
+# before it are checked.
+def mark_subset_species(logger, species_list):
+  start = time.time()
+  postings = {}
+  species_query_ids = []
+  for si, species in enumerate(species_list):
+    qids = []
+    for names in species.queries_set.values():
+      for qid in names:
+        postings.setdefault(qid, []).append(si)
+      qids.extend(names)
+    species_query_ids.append(qids)
+  logger.info(f"checking subset: {len(species_list)} species, {len(postings)} queries indexed")
+
+  candidate_count = 0
+  for si, species in enumerate(species_list):
+    qids = species_query_ids[si]
+    if len(qids) == 0:
+      continue
+    rarest = min(qids, key=lambda qid:len(postings[qid]))
+    for ci in postings[rarest]:
+      if ci >= si:
+        break
+      candidate_count += 1
+      if species_list[ci].contains(species):
+        species.is_subset = True
+        break
+  logger.info(f"checking subset (index) took {time.time() - start:.2f} seconds, {candidate_count} candidates checked")
 
-  logger.info("remove subset species from query")
-  for species in species_list:
-    if species.is_subset:
-      for qlist in species.queries.values():
-        for q in qlist:
-          q.species_list.remove(species.name)
-
-  old_len = len(species_list)
-  species_list = [sv for sv in species_list if not sv.is_subset]
-  new_len = len(species_list)
-  logger.info(f"{old_len - new_len} subset were removed")
-
-  logger.info("merge identical")
+# species_list should be sorted by query_count descendingly.
+# The identical species will be marked and appended to identical_species of the first species with same queries.
+def mark_identical_species_legacy(logger, species_list):
+  start = time.time()
   for sv in species_list:
     sv.is_identical = False
     sv.identical_species = []
@@ -346,108 +451,263 @@ def count_table(logger, input_list_file, output_prefix, taxonomy_file, species_f
       if species_list[i1].queries_set == species_list[i2].queries_set:
         species_list[i2].is_identical = True
         species_list[i1].identical_species.append(species_list[i2])
+  logger.info(f"checking identical (legacy) took {time.time() - start:.2f} seconds")
+
+def get_species_fingerprint(species):
+  return((species.query_count, hash(frozenset((sample, names.tobytes()) for sample, names in species.queries_set.items()))))
+
+# Same result as mark_identical_species_legacy. Species are grouped by fingerprint in one pass,
+# queries_set is only compared between species with same fingerprint.
+def mark_identical_species(logger, species_list):
+  start = time.time()
+  fingerprint_map = {}
+  for species in species_list:
+    species.is_identical = False
+    species.identical_species = []
+
+    candidates = fingerprint_map.setdefault(get_species_fingerprint(species), [])
+    for candidate in candidates:
+      if candidate.queries_set == species.queries_set:
+        species.is_identical = True
+        candidate.identical_species.append(species)
+        break
+    if not species.is_identical:
+      candidates.append(species)
+  logger.info(f"checking identical (fingerprint) took {time.time() - start:.2f} seconds, {len(fingerprint_map)} fingerprints")
+
+# build count objects from the group of each query. The groups are sorted by query count descendingly,
+# groups with same query count keep the order of first occurrence in query list.
+def build_group_list(query_store, query_groups, group_names, group_ranks):
+  groups, first_index, group_index = np.unique(query_groups, return_index=True, return_inverse=True)
+  matrix = query_store.sum_by_group(group_index.reshape(-1), query_store.counts, len(groups))
+  totals = matrix.sum(axis=1)
+  order = np.argsort(first_index, kind='stable')
+  order = order[np.argsort(-totals[order], kind='stable')]
+
+  result = []
+  for gi in order:
+    group = Species(group_names[gi], group_ranks[gi])
+    row = matrix[gi]
+    group.sample_query_count = {sample:row[sample] for sample in np.flatnonzero(row).tolist()}
+    group.query_count = totals[gi]
+    result.append(group)
+  return(result)
+
+# aggregate each query to unique node. The result contains nodes from different ranks.
+def build_aggregate_node_list(rank_aggregator, query_store, ranks, aggregate_rate):
+  query_ranks, query_codes = rank_aggregator.get_unique_rank(ranks, aggregate_rate)
+  groups, first_index = np.unique(query_codes, return_index=True)
+  group_names = [rank_aggregator.get_name(code) for code in groups.tolist()]
+  group_ranks = query_ranks[first_index]
+  return(build_group_list(query_store, query_codes, group_names, group_ranks))
+
+# aggregate each query to specific rank. The query doesn't aggregated to one node will be assigned to AmbiguousRanks.
+def build_aggregate_rank_list(rank_aggregator, query_store, rank, aggregate_rate):
+  query_codes = rank_aggregator.aggregate_to_rank(rank, aggregate_rate)
+  groups = np.unique(query_codes)
+  group_names = [rank_aggregator.get_name(code) for code in groups.tolist()]
+  return(build_group_list(query_store, query_codes, group_names, [rank] * len(groups)))
+
+# output features with dict of sample to count. Samples not in the dict are written as 0.
+def output_count_list(output_file, labels, sample_values, samples, label_headers=["Feature"], value_format="%d", dtype=np.int64, sample_index=None):
+  matrix = CountMatrix.from_dicts(labels, sample_values, len(samples), sample_index, dtype)
+  matrix.write(output_file, label_headers, samples, value_format)
+
+def output_rank_list(output_file, rank_list, samples, with_tax_id=False):
+  if with_tax_id:
+    labels = [f"{rank_obj.name}\t{rank_obj.taxid}\t{rank_obj.rank}" for rank_obj in rank_list]
+    label_headers = ["Rank_name", "TaxonomyId", "Rank"]
+  else:
+    labels = [f"{rank_obj.name}\t{rank_obj.rank}" for rank_obj in rank_list]
+    label_headers = ["Rank_name", "Rank"]
+  output_count_list(output_file, labels, [rank_obj.sample_query_count for rank_obj in rank_list], samples, label_headers)
+
+def get_feature_name(species):
+  if len(species.identical_species) > 0:
+    return(species.name + "," + ",".join([s.name for s in species.identical_species]))
+  return(species.name)
+  
+# Build species list from query list, the subset species are removed from species list and queries,
+# the identical species are marked.
+def build_unique_species_list(logger, query_list, species_table):
+  logger.info("building species list from query list ...")
+  species_list = build_species_list(query_list, species_table)
+
+  mark_subset_species(logger, species_list)
+
+  logger.info("remove subset species from query")
+  for species in species_list:
+    if species.is_subset:
+      for qlist in species.queries.values():
+        for q in qlist:
+          q.species_list.remove(species.id)
+
+  old_len = len(species_list)
+  species_list = [sv for sv in species_list if not sv.is_subset]
+  new_len = len(species_list)
+  logger.info(f"{old_len - new_len} subset were removed")
+
+  logger.info("merge identical")
+  mark_identical_species(logger, species_list)
 
   old_len = len(species_list)
   new_len = len([sv for sv in species_list if not sv.is_identical])
   logger.info(f"{old_len - new_len} identical species were found")
-  # if debug_mode:
-  #   myobj={ "species_taxonomy_map":species_taxonomy_map, 
-  #           "species_list": species_list,
-  #           "samples": samples,
-  #           "query_list": query_list }
-  #   with open(output_prefix + '.pickle', 'wb') as handle:
-  #     pickle.dump(myobj, handle, protocol=pickle.HIGHEST_PROTOCOL)
+  return(species_list)
+
+def count_table(logger, input_list_file, output_prefix, taxonomy_file, species_file, species_column='species', aggregate_rate=0.95, debug_mode=False, threads=1, read_memory_mb=0, cache_dir=None, resume=False, profiler=None):
+  import pandas as pd
+
+  if profiler == None:
+    profiler = StageProfiler()
+
+  profiler.start("taxonomy")
+  logger.info(f"Reading taxonomy from {taxonomy_file} ...")
+  taxonomy=pd.read_csv(taxonomy_file, sep="\t")
+  taxonomy_name_id_map=dict(zip(taxonomy.ScientificName, taxonomy.Id))
+  taxonomy_name_id_map['AmbiguousRanks'] = -1
+  taxonomy_name_id_map['Unclassified'] = -1
+
+  logger.info("reading species taxonomy map from " + species_file + "...")
+  species_taxonomy_map = read_species_taxonomy_map(species_file)
+  profiler.set_count("species", len(species_taxonomy_map))
+
+  file_map = read_file_map(input_list_file)
+
+  if cache_dir != None:
+    logger.info(f"parsed samples are cached in {cache_dir}")
+    os.makedirs(cache_dir, exist_ok=True)
 
+  samples=list(file_map.keys())
+  sample_ids=list(range(len(samples)))
+
+  checkpoint = None
+  if resume:
+    checkpoint = StageCheckpoint(logger,
+                                 output_prefix + ".checkpoint",
+                                 [input_list_file, taxonomy_file, species_file] + list(file_map.values()),
+                                 {"species_column":species_column, "aggregate_rate":aggregate_rate, "debug_mode":debug_mode})
+
+  #in order to save memory, we handle the sequence first. then in query mode, we don't need to store sequence anymore.
+  profiler.start("reads")
+  if checkpoint != None and checkpoint.exists("reads") and os.path.exists(output_prefix + ".read.count"):
+    logger.info("sequence table was built, skip it.")
+  else:
+    if read_memory_mb > 0:
+      logger.info(f"building sequence table by external sort with {read_memory_mb} MB memory ...")
+      profiler.set_count("reads", write_read_count_table(logger, file_map, output_prefix + ".read.count", read_memory_mb, debug_mode, threads))
+    else:
+      logger.info("building sequence list ...")
+      sequence_list = read_sequence_list(logger, file_map, debug_mode, threads, cache_dir)
+      profiler.set_count("reads", len(sequence_list))
+      output_count_list(output_prefix + ".read.count",
+                        [sequence.seq for sequence in sequence_list],
+                        [sequence.sample_query_count for sequence in sequence_list],
+                        samples,
+                        label_headers=["Sequence"],
+                        sample_index={sample:idx for idx, sample in enumerate(samples)})
+      sequence_list = None
+    if checkpoint != None:
+      checkpoint.save("reads", True)
+
+  profiler.start("queries")
+  state = checkpoint.load("species") if checkpoint != None else None
+  if state != None:
+    query_list, species_table, species_list = state
+  else:
+    state = checkpoint.load("queries") if checkpoint != None else None
+    if state != None:
+      query_list, species_table = state
+    else:
+      logger.info("building query list ...")
+      species_table = SymbolTable()
+      query_list = read_query_list(logger, file_map, species_table, debug_mode, threads, cache_dir)
+      if checkpoint != None:
+        checkpoint.save("queries", (query_list, species_table))
+
+    profiler.set_count("queries", len(query_list))
+    profiler.start("species")
+    species_list = build_unique_species_list(logger, query_list, species_table)
+    if checkpoint != None:
+      checkpoint.save("species", (query_list, species_table, species_list))
+      checkpoint.remove("queries")
+  state = None
+  profiler.set_count("queries", len(query_list))
+  profiler.set_count("species", len(species_list))
+
+  profiler.start("query_store")
+  logger.info("building query store ...")
+  query_store = QueryStore.from_query_list(query_list, len(samples))
+
+  logger.info("building rank aggregator ...")
+  rank_aggregator = RankAggregator(species_taxonomy_map, query_list, species_table)
+
+  profiler.start("species_output")
   logger.info(f"output aggregated count of rank species ...")
-  rank_list = build_aggregate_rank_list(query_list, species_taxonomy_map, "species", aggregate_rate)
+  rank_list = build_aggregate_rank_list(rank_aggregator, query_store, "species", aggregate_rate)
   output_rank_list(output_prefix + f".species.aggregated.count", rank_list, samples, with_tax_id=False)
   rank_list = None
 
   logger.info(f"output query count of rank species ...")
-  with open(output_prefix + ".species.query.count", "wt") as fout:
-    fout.write("Feature\t" + "\t".join(samples) + "\n")
-    for species in species_list:
-      if species.is_identical:
-        continue
-      species_name = species.name
-      if len(species.identical_species) > 0:
-        species_name = species_name + "," + ",".join([s.name for s in species.identical_species])
-      countstr = "\t".join(str(species.sample_query_count[sample]) if sample in species.sample_query_count else "0" for sample in samples)
-      fout.write(f"{species_name}\t{countstr}\n")
+  unique_species_list = [species for species in species_list if not species.is_identical]
+  unique_species_names = [get_feature_name(species) for species in unique_species_list]
+  output_count_list(output_prefix + ".species.query.count",
+                    unique_species_names,
+                    [species.sample_query_count for species in unique_species_list],
+                    samples)
 
   logger.info(f"output estimated count of rank species ...")
-  for query in query_list:
-    query.estimate_count()
-
-  for species in species_list:
-    species.sum_estimated_count()
-
-  with open(output_prefix + ".species.estimated.count", "wt") as fout:
-    fout.write("Feature\t" + "\t".join(samples) + "\n")
-    for species in species_list:
-      if species.is_identical:
-        continue
-
-      species_name = species.name
-      if len(species.identical_species) > 0:
-        species_name = species_name + "," + ",".join([s.name for s in species.identical_species])
-      countstr = "\t".join("{:.2f}".format(species.sample_estimated_count[sample]) if sample in species.sample_estimated_count else "0" for sample in samples)
-      fout.write(f"{species_name}\t{countstr}\n")
+  species_estimated_matrix = query_store.sum_by_species(query_store.estimate_counts(), len(species_table))
+  species_estimated = np.empty((len(species_list), len(samples)))
+  for idx, species in enumerate(species_list):
+    row = species_estimated_matrix[species.id] * species.num_of_species()
+    species_estimated[idx] = row
+    species.sample_estimated_count = {sample:row[sample] for sample in species.queries.keys()}
+    species.estimated_count = sum(species.sample_estimated_count.values())
+  species_estimated_matrix = None
+
+  output_count_list(output_prefix + ".species.estimated.count",
+                    unique_species_names,
+                    [species.sample_estimated_count for species in unique_species_list],
+                    samples,
+                    value_format="%.2f",
+                    dtype=np.float64)
+  unique_species_list = None
+  unique_species_names = None
 
   levels = [ 'genus', 'family', 'order', 'class', 'phylum']
+  profiler.start("level_output")
+  logger.info(f"rolling up query/estimated count of ranks {levels} ...")
+  level_rollup = LevelRollup(species_taxonomy_map, species_list, len(species_table), levels)
+  level_counts = level_rollup.rollup(query_store, species_estimated)
+  species_estimated = None
+
   for level in levels:
     logger.info(f"output aggregated count of rank {level} ...")
-    rank_list = build_aggregate_rank_list(query_list, species_taxonomy_map, level, aggregate_rate)
+    rank_list = build_aggregate_rank_list(rank_aggregator, query_store, level, aggregate_rate)
     output_rank_list(output_prefix + f".{level}.aggregated.count", rank_list, samples, with_tax_id=False)
     rank_list = None
+    logger.info(f"rank aggregation cache: {rank_aggregator.cache.summary()}")
 
     logger.info(f"output query/estimated count of rank {level} ...")
-    cat_map = {}
-    for species in species_list:
-      cat_name = species_taxonomy_map[species.name][level]
-      #print(species.name + ": " + cat_name)
-      if cat_name not in cat_map:
-        cat_map[cat_name] = Species(cat_name)
-      cat_map[cat_name].identical_species.append(species)
-    
-    cats = [cat for cat in cat_map.values()]
-    for cat in cats:
-      cat.sample_query_count = {}
-      for sample in samples:
-        squeries_set = set()
-        for species in cat.identical_species:
-          if sample in species.queries:
-            for query in species.queries[sample]:
-              squeries_set.add(query)
-        scount = sum([query.count for query in squeries_set])
-        cat.sample_query_count[sample] = scount
-      cat.query_count = sum([v for v in cat.sample_query_count.values()])
-
-      cat.estimated_count = sum([species.estimated_count for species in cat.identical_species])
-      cat.sample_estimated_count = {sample: sum([species.sample_estimated_count[sample] if sample in species.sample_estimated_count else 0 for species in cat.identical_species]) for sample in samples}
-      
-    cats.sort(key=lambda x:x.query_count, reverse=True)
-
-    with open(output_prefix + "." + level + ".query.count", "wt") as fout:
-      fout.write("Feature\t" + "\t".join(samples) + "\n")
-      for species in cats:
-        species_name = species.name
-        countstr = species.get_query_count_str(samples)
-        fout.write(f"{species_name}\t{countstr}\n")
-
-    with open(output_prefix + "." + level + ".estimated.count", "wt") as fout:
-      fout.write("Feature\t" + "\t".join(samples) + "\n")
-      for species in cats:
-        species_name = species.name
-        countstr = species.get_estimated_count_str(samples)
-        fout.write(f"{species_name}\t{countstr}\n")
+    cat_names, query_matrix, estimated_matrix = level_counts.pop(level)
+    present = np.ones(query_matrix.shape, dtype=bool)
+    CountMatrix.from_dense(cat_names, query_matrix, present).write(output_prefix + "." + level + ".query.count", ["Feature"], samples)
+    CountMatrix.from_dense(cat_names, estimated_matrix, present).write(output_prefix + "." + level + ".estimated.count", ["Feature"], samples, value_format="%.2f")
 
+  profiler.start("tree_output")
   logger.info("output aggregated node ...")
   ranks=[ 'genus', 'family', 'order', 'class', 'phylum', 'superkingdom']
-  rank_list = build_aggregate_node_list(query_list, species_taxonomy_map, ranks, aggregate_rate)
+  rank_list = build_aggregate_node_list(rank_aggregator, query_store, ranks, aggregate_rate)
+  logger.info(f"rank aggregation cache: {rank_aggregator.cache.summary()}")
   for rank in rank_list:
     rank.taxid = taxonomy_name_id_map[rank.name]
   output_rank_list(output_prefix + ".tree.count", rank_list, samples, with_tax_id=True)
+  profiler.set_count("nodes", len(rank_list))
+  profiler.stop()
+
+  if checkpoint != None:
+    checkpoint.clear()
 
   logger.info("done")
 
@@ -13,6 +13,8 @@ from io import BytesIO, TextIOWrapper
 from .BowtieIndex import BowtieIndexItem, readBowtieIndexList, writeBowtieIndexList
 from .GenomeItem import GenomeItem, writeGenomeItems, readGenomeItems
 from .Taxonomy import TaxonomyItem, TaxonomyTree
+from .compress_util import open_compressed
+from .StageProfiler import StageProfiler
 
 class CategoryItem(object):
   def __init__(self, fileHandle, index, numberOfGenome):
@@ -290,7 +292,7 @@ class AssemblyGenome:
     self.local_fna_path=os.path.join(sub_folder, file_name)
     self.local_done_path=self.local_fna_path + ".done"
 
-def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomyRootId, outputFolder, prefix, genomeNumberPerFile=500, referenceAndRepresentativeOnly=True):
+def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomyRootId, outputFolder, prefix, genomeNumberPerFile=500, referenceAndRepresentativeOnly=True, profiler=None):
   # taxonomyFile = '/data/cqs/references/bacteria/20220406_taxonomy.txt'
   # assemblySummaryFile = '/data/cqs/references/bacteria/20220406_assembly_summary_refseq.txt'
   # taxonomyRootId = 2 
@@ -299,8 +301,13 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
 
   ref_categories = ['reference genome', 'representative genome']
 
+  if profiler == None:
+    profiler = StageProfiler()
+
+  profiler.start("taxonomy")
   logger.info(f"Reading taxonomy from {taxonomyFile} ...")
   taxonomy=pd.read_csv(taxonomyFile, sep="\t", index_col=0)
+  profiler.set_count("taxonomy", len(taxonomy))
 
   if not taxonomyRootId in taxonomy.index:
     raise Exception(f'Cannot find taxonomy id {taxonomyRootId} in {taxonomyFile}')
@@ -318,6 +325,7 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
   if not os.path.exists(fastaDir):
     os.mkdir(fastaDir)
 
+  profiler.start("assembly")
   logger.info(f"Reading assembly summary from {assemblySummaryFile} ...")
   assembly=pd.read_csv(assemblySummaryFile, sep="\t", header=1, index_col=0)
 
@@ -330,7 +338,10 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
     genome = AssemblyGenome(row.Index, row.taxid, row.organism_name, row.ftp_path, cacheDir )
     genomes.append(genome)
   logger.info(f"Total {len(genomes)} genomes ...")
+  profiler.set_count("genomes", len(genomes))
 
+  profiler.start("download_genome")
+  profiler.set_count("missing_genomes", len([g for g in genomes if not os.path.exists(g.local_done_path)]))
   for rep in [1,2,3]:
     #cache all genome
     missing_genomes =[g for g in genomes if not os.path.exists(g.local_done_path)] 
@@ -359,6 +370,7 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
               ftp = open_ftp()
 
   #download gtf file
+  profiler.start("download_gtf")
   logger.error("Downloading gtf files.")
   with open_ftp() as ftp:
     currentCount = 0
@@ -387,6 +399,7 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
     for miss in missing_genomes:
       logger.error(f"  {miss.remote_file_path}")
   else:
+    profiler.start("output_fasta")
     logger.info("Output fasta file ...")
     output_ranks = ['superkingdom', 'kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
     bowtieIndecies = []
@@ -395,6 +408,7 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
       findex = 0
       fFasta = None
       gindex = 0
+      chrom_count = 0
       for genome in genomes:
         gtax = taxonomy.loc[genome.taxid]
         if gindex % genomeNumberPerFile == 0:
@@ -424,9 +438,14 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
                     rtex=taxonomy.loc[taxonomyId]
                     ftx.write(f"\t{rtex.ScientificName}")
                 ftx.write("\n")
+                chrom_count += 1
         fFasta.close() 
     writeBowtieIndexList(os.path.join(outputFolder, prefix + ".index.txt"), bowtieIndecies)
+    profiler.set_count("genomes", gindex)
+    profiler.set_count("chromosomes", chrom_count)
+    profiler.set_count("files", len(bowtieIndecies))
 
+    profiler.start("output_gtf")
     gtf_file = os.path.join(fastaDir, prefix + ".gtf")
     with open(gtf_file, "wb") as fgtf:
       with open(gtf_file + ".missing", "wt") as fgtfmiss:
@@ -439,6 +458,7 @@ def prepare_segment_database(logger, taxonomyFile, assemblySummaryFile, taxonomy
           else:
             fgtfmiss.write(f"{genome.local_fna_path}\n")
 
+  profiler.stop()
   logger.info("Done.")
 
 def prepare_index(logger, categoryFile, thread, force=False, slurmTemplate=None):
@@ -524,7 +544,7 @@ def fastq_to_database(logger, fastq_file, sample_name, output_file, reads_per_fi
     fout = None
     fastq_files = fastq_file.split(",")
     for fq in fastq_files:
-      fin = gzip.open(fq, "rt") if fq.endswith(".gz") else open(fq, "rt")
+      fin = open_compressed(fq, "rt") if fq.endswith(".gz") else open(fq, "rt")
       with fin:
         while True:
           query = fin.readline()
@@ -538,7 +558,7 @@ def fastq_to_database(logger, fastq_file, sample_name, output_file, reads_per_fi
             bowtie_index = os.path.join(fastaDir, "%s.%d" % ( sample_name, file_index ))
             if gzipped:
               cur_file = bowtie_index + ".fasta.gz"
-              fout = gzip.open(cur_file, "wt")
+              fout = open_compressed(cur_file, "wt")
             else:
               cur_file = bowtie_index + ".fasta"
               fout = open(cur_file, "wt")
@@ -1,14 +1,24 @@
+import heapq
 import logging
-import gzip
+import math
+import os
+import tempfile
+import zlib
+
+from .compress_util import open_compressed
+
+# Maximum number of bucket files, they are all open at the same time
+MAX_BUCKETS = 512
 
 def take_count(elem):
     return elem[0]
 
-def collapse_fastq(logger, inputFile, outputFilePrefix):
-  qname_map = {}
+def get_qname(query):
+  return(query.split('\t', 1)[0].split(' ', 1)[0])
 
-  logger.info(f"reading {inputFile} ...")
-  fin = gzip.open(inputFile, "rt") if inputFile.endswith(".gz") else open(inputFile, "rt")
+# yield (query, sequence, line2, score) of each fastq record, lines keep their line break
+def read_fastq_records(logger, inputFile):
+  fin = open_compressed(inputFile, "rt") if inputFile.endswith(".gz") else open(inputFile, "rt")
   with fin:
     icount = 0
     while True:
@@ -23,33 +33,149 @@ def collapse_fastq(logger, inputFile, outputFilePrefix):
         raise Exception(f"Error format: query={query.rstrip()}")
 
       if len(sequence) != len(score):
-        raise Exception(f"Error format: seq={sequence.rstrip()}, score={score.rtrip()}")
+        raise Exception(f"Error format: seq={sequence.rstrip()}, score={score.rstrip()}")
 
       icount += 1
       if icount % 100000 == 0:
         logger.info(icount)
         #break
 
-      seq_array = qname_map.get(sequence)
-      if seq_array == None:
-        qname = query.split('\t', 1)[0].split(' ', 1)[0]
-        seq_array = [1, qname, sequence, line2, score]
-        qname_map[sequence] = seq_array
-      else:
-        seq_array[0] = seq_array[0] + 1
+      yield (query, sequence, line2, score)
+
+def write_collapsed(fout, fcount, count, query, sequence, line2, score):
+  qname = get_qname(query)
+  fcount.write(f"{qname[1:]}\t{count}\t{sequence}")
+  fout.write(f"{qname}\n{sequence}{line2}{score}")
+
+def collapse_fastq(logger, inputFile, outputFilePrefix, memory_mb=0):
+  if memory_mb > 0:
+    collapse_fastq_by_buckets(logger, inputFile, outputFilePrefix, memory_mb)
+    return
+
+  qname_map = {}
+
+  logger.info(f"reading {inputFile} ...")
+  for query, sequence, line2, score in read_fastq_records(logger, inputFile):
+    seq_array = qname_map.get(sequence)
+    if seq_array == None:
+      seq_array = [1, query, sequence, line2, score]
+      qname_map[sequence] = seq_array
+    else:
+      seq_array[0] = seq_array[0] + 1
 
   logger.info(f"writing {outputFilePrefix} ...")
   queries = list(qname_map.values())
   queries.sort(key=take_count, reverse=True)
-  with gzip.open(outputFilePrefix + ".gz", "wt") as fout:
+  with open_compressed(outputFilePrefix + ".gz", "wt") as fout:
     with open(outputFilePrefix + ".dupcount", "wt") as fcount:
       fcount.write("Query\tCount\tSequence\n")
       for query in queries:
-        fcount.write(f"{query[1][1:]}\t{query[0]}\t{query[2]}")
-        fout.write(f"{query[1]}\n{query[2]}{query[3]}{query[4]}")
+        write_collapsed(fout, fcount, *query)
+
+  logger.info("done")
+
+# Record in bucket and run files takes 5 lines: "count<tab>first index", query, sequence, line2 and score.
+def write_bucket_record(fout, count, index, query, sequence, line2, score):
+  fout.write(f"{count}\t{index}\n{query}{sequence}{line2}{score}")
+
+def read_bucket_records(bucket_file):
+  with open(bucket_file, "rt") as fin:
+    while True:
+      header = fin.readline()
+      if not header:
+        break
+      count, index = header.split('\t')
+      yield (-int(count), int(index), fin.readline(), fin.readline(), fin.readline(), fin.readline())
+
+def get_bucket_count(inputFile, memory_mb):
+  # gzipped fastq is about 4 times smaller than text
+  estimated_size = os.path.getsize(inputFile) * (4 if inputFile.endswith(".gz") else 1)
+  return(min(MAX_BUCKETS, max(1, math.ceil(estimated_size / (memory_mb * 1024 * 1024)))))
+
+# Collapse fastq with bounded memory, the output is same as collapse_fastq in memory.
+# 1. records are partitioned by hash of sequence into bucket files, with their index in input.
+# 2. each bucket is collapsed in memory and written as run sorted by count descending then first index.
+# 3. runs are k-way merged by count descending then first index, which is the order of stable sort in memory.
+def collapse_fastq_by_buckets(logger, inputFile, outputFilePrefix, memory_mb):
+  num_buckets = get_bucket_count(inputFile, memory_mb)
+  output_folder = os.path.dirname(os.path.abspath(outputFilePrefix))
+  with tempfile.TemporaryDirectory(prefix=os.path.basename(outputFilePrefix) + ".", dir=output_folder) as folder:
+    logger.info(f"partitioning {inputFile} to {num_buckets} buckets ...")
+    bucket_files = [os.path.join(folder, f"bucket.{idx}") for idx in range(num_buckets)]
+    fouts = [open(bucket_file, "wt") for bucket_file in bucket_files]
+    try:
+      for index, (query, sequence, line2, score) in enumerate(read_fastq_records(logger, inputFile)):
+        write_bucket_record(fouts[zlib.crc32(sequence.encode()) % num_buckets], 1, index, query, sequence, line2, score)
+    finally:
+      for fout in fouts:
+        fout.close()
+
+    run_files = []
+    for bucket_file in bucket_files:
+      logger.info(f"collapsing {os.path.basename(bucket_file)} ...")
+      qname_map = {}
+      for _, index, query, sequence, line2, score in read_bucket_records(bucket_file):
+        seq_array = qname_map.get(sequence)
+        if seq_array == None:
+          qname_map[sequence] = [-1, index, query, sequence, line2, score]
+        else:
+          seq_array[0] -= 1
+      os.remove(bucket_file)
+
+      run_file = bucket_file + ".run"
+      with open(run_file, "wt") as fout:
+        for seq_array in sorted(qname_map.values(), key=lambda x:(x[0], x[1])):
+          write_bucket_record(fout, -seq_array[0], *seq_array[1:])
+      qname_map = None
+      run_files.append(run_file)
+
+    logger.info(f"writing {outputFilePrefix} ...")
+    with open_compressed(outputFilePrefix + ".gz", "wt") as fout:
+      with open(outputFilePrefix + ".dupcount", "wt") as fcount:
+        fcount.write("Query\tCount\tSequence\n")
+        for neg_count, _, query, sequence, line2, score in heapq.merge(*[read_bucket_records(run_file) for run_file in run_files]):
+          write_collapsed(fout, fcount, -neg_count, query, sequence, line2, score)
 
   logger.info("done")
 
+# Collapse identical sequences of fastq while converting it to fasta: each unique sequence is written to fastaFile once
+# by the name of its first read, when it first appears. The count of each unique sequence is written to dupcountFile
+# sorted by count descending, same as collapse_fastq. Return number of reads and unique sequences.
+def collapse_fastq_to_fasta(logger, inputFile, fastaFile, dupcountFile):
+  qname_map = {}
+
+  logger.info(f"collapsing {inputFile} to {fastaFile} ...")
+  fin = open_compressed(inputFile, "rt") if inputFile.endswith(".gz") else open(inputFile, "rt")
+  with fin, open(fastaFile, "wt") as fout:
+    icount = 0
+    while True:
+      query = fin.readline()
+      if not query:
+        break
+      sequence = fin.readline().rstrip()
+      fin.readline()
+      fin.readline()
+
+      icount += 1
+      if icount % 1000000 == 0:
+        logger.info(icount)
+
+      seq_array = qname_map.get(sequence)
+      if seq_array == None:
+        qname = query.rstrip().split('\t', 1)[0].split(' ', 1)[0][1:]
+        qname_map[sequence] = [1, qname]
+        fout.write(f">{qname}\n{sequence}\n")
+      else:
+        seq_array[0] = seq_array[0] + 1
+
+  logger.info(f"writing {dupcountFile} ...")
+  queries = sorted(qname_map.items(), key=lambda x:x[1][0], reverse=True)
+  with open(dupcountFile, "wt") as fcount:
+    fcount.write("Query\tCount\tSequence\n")
+    for sequence, (count, qname) in queries:
+      fcount.write(f"{qname}\t{count}\t{sequence}\n")
+  return(icount, len(queries))
+
 if __name__ == "__main__":
   logger = logging.getLogger('collapse_fastq')
   logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)-8s - %(message)s')
@@ -0,0 +1,145 @@
+import heapq
+import os
+import tempfile
+from functools import partial
+from itertools import groupby
+
+from .common_util import map_in_order
+from .compress_util import open_compressed
+from .CountBundle import CountBundle, is_count_bundle
+
+# Estimated bytes of one buffered row besides its strings
+ROW_OVERHEAD = 160
+
+# converters of (sequence, sample index, line index, count) rows
+SEQUENCE_COLUMNS = (str, int, int, int)
+
+# converters of (-total count, first sample index, first line index, sequence, sample:count list) rows
+TOTAL_COLUMNS = (int, int, int, str, str)
+
+def write_run(run_file, rows):
+  with open(run_file, "wt") as fout:
+    for row in rows:
+      fout.write("\t".join(str(v) for v in row) + "\n")
+
+def read_run(run_file, columns):
+  with open(run_file, "rt") as fin:
+    for line in fin:
+      parts = line.rstrip("\n").split("\t")
+      yield tuple(column(part) for column, part in zip(columns, parts))
+
+# Buffer rows and spill them as sorted run files when the estimated size reaches memory_bytes
+class RunWriter(object):
+  def __init__(self, folder, name, memory_bytes):
+    self.folder = folder
+    self.name = name
+    self.memory_bytes = memory_bytes
+    self.rows = []
+    self.size = 0
+    self.runs = []
+
+  def add(self, row, size):
+    self.rows.append(row)
+    self.size += size
+    if self.size >= self.memory_bytes:
+      self.spill()
+
+  def spill(self):
+    if len(self.rows) == 0:
+      return
+    self.rows.sort()
+    run_file = os.path.join(self.folder, f"{self.name}.{len(self.runs)}.run")
+    write_run(run_file, self.rows)
+    self.runs.append(run_file)
+    self.rows = []
+    self.size = 0
+
+  def close(self):
+    self.spill()
+    return(self.runs)
+
+# k-way merge of sorted runs. Runs are merged in passes of fan_in files to limit open files.
+def merge_runs(folder, name, runs, columns, fan_in=64):
+  level = 0
+  while len(runs) > fan_in:
+    merged = []
+    for start in range(0, len(runs), fan_in):
+      group = runs[start:start + fan_in]
+      run_file = os.path.join(folder, f"{name}.merge{level}.{len(merged)}.run")
+      write_run(run_file, heapq.merge(*[read_run(run, columns) for run in group]))
+      for run in group:
+        os.remove(run)
+      merged.append(run_file)
+    runs = merged
+    level += 1
+  return(heapq.merge(*[read_run(run, columns) for run in runs]))
+
+# (sequence, count) of each row in bowtie_count output, text or bundle
+def read_sequence_counts(count_file, debug_mode=False):
+  if is_count_bundle(count_file):
+    bundle = CountBundle.load(count_file)
+    row_count = bundle.get_row_count(debug_mode)
+    yield from zip(bundle.get_sequences()[:row_count], bundle.counts[:row_count].tolist())
+    return
+
+  with open_compressed(count_file, "rt") as fin:
+    fin.readline()
+    for line_index, bl in enumerate(fin):
+      if debug_mode and line_index == 10000:
+        break
+      bparts = bl.split('\t')
+      yield (bparts[2], int(bparts[1]))
+
+def write_sample_sequence_runs(logger, folder, memory_bytes, debug_mode, sample_file):
+  sample_id, count_file = sample_file
+  if logger != None:
+    logger.info(f"parsing {count_file} for sequence ...")
+
+  writer = RunWriter(folder, f"sequence.{sample_id}", memory_bytes)
+  for line_index, (seq, count) in enumerate(read_sequence_counts(count_file, debug_mode)):
+    writer.add((seq, sample_id, line_index, count), len(seq) + ROW_OVERHEAD)
+  return(writer.close())
+
+# Build read count table (sequence x sample) by external sort, the rows are buffered up to memory_mb in each process.
+# 1. rows of each sample are spilled to runs sorted by sequence.
+# 2. runs of all samples are merged by sequence to aggregate sample counts. The aggregated rows are spilled to runs sorted
+#    by total count descending then first appearance (sample index, line index), same order as read_sequence_list.
+# 3. the aggregated runs are merged to output_file.
+# Return the number of sequences.
+def write_read_count_table(logger, file_map, output_file, memory_mb=1024, debug_mode=False, threads=1):
+  samples = list(file_map.keys())
+  memory_bytes = max(1, int(memory_mb * 1024 * 1024 / max(1, threads)))
+  output_folder = os.path.dirname(os.path.abspath(output_file))
+  with tempfile.TemporaryDirectory(prefix=os.path.basename(output_file) + ".", dir=output_folder) as folder:
+    runs = []
+    items = list(enumerate(file_map.values()))
+    for sample_runs in map_in_order(partial(write_sample_sequence_runs, logger, folder, memory_bytes, debug_mode), items, threads):
+      runs.extend(sample_runs)
+    logger.info(f"merging {len(runs)} sequence runs ...")
+
+    writer = RunWriter(folder, "total", memory_bytes * max(1, threads))
+    for seq, rows in groupby(merge_runs(folder, "sequence", runs, SEQUENCE_COLUMNS), key=lambda x:x[0]):
+      first = None
+      total = 0
+      sample_counts = {}
+      for row in rows:
+        if first == None:
+          first = row
+        sample_counts[row[1]] = row[3]
+        total += row[3]
+      counts = ",".join(f"{sample_id}:{count}" for sample_id, count in sample_counts.items())
+      writer.add((-total, first[1], first[2], seq, counts), len(seq) + len(counts) + ROW_OVERHEAD)
+    runs = writer.close()
+    logger.info(f"writing {output_file} from {len(runs)} sorted runs ...")
+
+    row_count = 0
+    with open(output_file, "wt") as fout:
+      fout.write("\t".join(["Sequence"] + samples) + "\n")
+      for _, _, _, seq, counts in merge_runs(folder, "total", runs, TOTAL_COLUMNS):
+        row_count += 1
+        values = ["0"] * len(samples)
+        for item in counts.split(","):
+          sample_id, count = item.split(":")
+          values[int(sample_id)] = count
+        fout.write(seq + "\t" + "\t".join(values) + "\n")
+  return(row_count)
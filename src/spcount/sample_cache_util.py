@@ -0,0 +1,46 @@
+import glob
+import hashlib
+import os
+import pickle
+
+# increase it when the parsed result of sample is changed
+SAMPLE_CACHE_VERSION = 1
+
+def get_hash(text):
+  return(hashlib.sha1(text.encode("utf-8")).hexdigest())
+
+# Cache file name has two parts: hash of path, and hash of size/mtime/options, so the stale entries of changed file
+# can be found by path.
+def get_sample_cache_file(cache_dir, kind, count_file, debug_mode):
+  path = os.path.abspath(count_file)
+  stat = os.stat(path)
+  state = f"{stat.st_size}\t{stat.st_mtime_ns}\t{debug_mode}\t{SAMPLE_CACHE_VERSION}"
+  return(os.path.join(cache_dir, f"{kind}.{get_hash(path)}.{get_hash(state)}.pickle"))
+
+def remove_stale_sample_cache(cache_file):
+  prefix = cache_file[:cache_file.rindex(".", 0, cache_file.rindex("."))]
+  for stale_file in glob.glob(prefix + ".*.pickle"):
+    if stale_file != cache_file:
+      os.remove(stale_file)
+
+# Return parsed result of count_file by func(logger, debug_mode, count_file). The result is cached in cache_dir and reused
+# until the path, size or mtime of count_file is changed. Nothing is cached if cache_dir is None.
+def read_sample_cached(cache_dir, kind, func, logger, debug_mode, count_file):
+  if cache_dir == None:
+    return(func(logger, debug_mode, count_file))
+
+  cache_file = get_sample_cache_file(cache_dir, kind, count_file, debug_mode)
+  if os.path.exists(cache_file):
+    if logger != None:
+      logger.info(f"reading {kind} of {count_file} from cache ...")
+    with open(cache_file, "rb") as fin:
+      return(pickle.load(fin))
+
+  result = func(logger, debug_mode, count_file)
+
+  remove_stale_sample_cache(cache_file)
+  tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+  with open(tmp_file, "wb") as fout:
+    pickle.dump(result, fout, protocol=pickle.HIGHEST_PROTOCOL)
+  os.replace(tmp_file, cache_file)
+  return(result)
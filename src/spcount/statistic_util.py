@@ -8,7 +8,7 @@ def shannon_value(x):
 def do_shannon(count_data):
   perc_count = count_data.div(count_data.sum(axis=0), axis=1)
 
-  s_values = perc_count.applymap(shannon_value)
+  s_values = shannon_value(perc_count)
   shannon_values=s_values.sum(axis=0)
   shannon_values.name = "shannon"
   shannon_values.index.name = "sample"
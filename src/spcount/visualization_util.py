@@ -41,7 +41,8 @@ def get_taxonomy_id(name_map, row):
 def get_rank(name_map, row):  
   return (name_map[row['Feature']]['rank'])
 
-def krona(logger, treeFile, groupFile, taxonomyFolder, outputPrefix):
+# Build the tree count with taxonomy id and rank, and the group count table, which are the inputs of ktImportTaxonomy.
+def build_krona_tables(logger, treeFile, groupFile, taxonomyFolder, outputPrefix):
   tree_data = pd.read_csv(treeFile, sep="\t")
   if tree_data.columns[1] != "TaxonomyId":
     name_map = read_taxonomy_name_map(os.path.join(taxonomyFolder, "taxonomy.tab"))
@@ -50,12 +51,6 @@ def krona(logger, treeFile, groupFile, taxonomyFolder, outputPrefix):
     treeFile=outputPrefix + ".tree.count"
     tree_data.to_csv(treeFile, sep="\t", index=False)
 
-  logger.info("Start sample krona ...")
-  
-  draw_krona(logger, treeFile, taxonomyFolder, outputPrefix)
-
-  logger.info("Start group krona ...")
-
   logger.info(f"Read group info {groupFile} ...")
   groups_df=pd.read_csv(groupFile, sep="\t", header=None)
   groups_df.rename(columns={groups_df.columns[0]:"sample_name", groups_df.columns.values[1]:"group_name"}, inplace=True)
@@ -76,6 +71,16 @@ def krona(logger, treeFile, groupFile, taxonomyFolder, outputPrefix):
 
   group_file = outputPrefix + ".group.txt"
   group_data.to_csv(group_file, sep="\t", index=None)
+  return(treeFile, group_file)
+
+def krona(logger, treeFile, groupFile, taxonomyFolder, outputPrefix):
+  treeFile, group_file = build_krona_tables(logger, treeFile, groupFile, taxonomyFolder, outputPrefix)
+
+  logger.info("Start sample krona ...")
+  
+  draw_krona(logger, treeFile, taxonomyFolder, outputPrefix)
+
+  logger.info("Start group krona ...")
 
   draw_krona(logger, group_file, taxonomyFolder, outputPrefix)
 
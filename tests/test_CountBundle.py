@@ -0,0 +1,45 @@
+from context import spcount
+
+from spcount.CountBundle import CountBundle, pack_sequences, unpack_sequences, is_count_bundle
+
+import gzip
+import os
+import tempfile
+import unittest
+import numpy as np
+
+class TestCountBundle(unittest.TestCase):
+  def test_pack_sequences(self):
+    sequences = ["ACGTA", "", "NNACG", "acgT", "T"]
+    packed = pack_sequences(sequences)
+    self.assertEqual(4, len(packed[1]))
+    self.assertEqual([5, 6, 10, 11, 12], packed[2].tolist())
+    self.assertEqual(sequences, unpack_sequences(*packed))
+
+  def test_write_load(self):
+    with tempfile.TemporaryDirectory() as folder:
+      filename = os.path.join(folder, "sample.npz")
+      CountBundle.write(filename, ["r1", "r2", "r3"], [10, 5, 5], ["ACGT", "GGNC", "TTTTT"], ["SpeciesA", "SpeciesB", "SpeciesC"], [[0, 2], [1], [0, 1, 2]])
+      bundle = CountBundle.load(filename)
+      self.assertIsInstance(bundle.counts, np.memmap)
+      self.assertEqual(3, len(bundle))
+      self.assertEqual([10, 5, 5], bundle.counts.tolist())
+      self.assertEqual(["r1", "r2", "r3"], bundle.get_read_names())
+      self.assertEqual(["ACGT", "GGNC", "TTTTT"], bundle.get_sequences())
+      self.assertEqual(["SpeciesA", "SpeciesC"], bundle.get_species_names(0))
+      self.assertEqual(["SpeciesA", "SpeciesB", "SpeciesC"], bundle.get_species_names(2))
+      bundle = None
+
+  def test_is_count_bundle(self):
+    with tempfile.TemporaryDirectory() as folder:
+      bundle_file = os.path.join(folder, "sample.txt.gz")
+      CountBundle.write(bundle_file, ["r1"], [1], ["ACGT"], ["SpeciesA"], [[0]])
+      self.assertTrue(is_count_bundle(bundle_file))
+
+      text_file = os.path.join(folder, "sample.npz")
+      with gzip.open(text_file, "wt") as fout:
+        fout.write("read\tcount\tsequence\tspecies\n")
+      self.assertFalse(is_count_bundle(text_file))
+
+if __name__ == '__main__':
+  unittest.main()
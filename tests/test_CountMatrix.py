@@ -0,0 +1,36 @@
+from context import spcount
+
+from spcount.CountMatrix import CountMatrix
+
+import os
+import random
+import tempfile
+import unittest
+import numpy as np
+
+class TestCountMatrix(unittest.TestCase):
+  def write_and_read(self, matrix, value_format, block_size):
+    with tempfile.TemporaryDirectory() as tmp_folder:
+      output_file = os.path.join(tmp_folder, "count.txt")
+      matrix.write(output_file, ["Feature", "Rank"], ["S1", "S2", "S3"], value_format, block_size)
+      with open(output_file, "rt") as fin:
+        return(fin.read())
+
+  def test_from_dicts(self):
+    rnd = random.Random(1)
+    labels = [f"feature{i}\tspecies" for i in range(25)]
+    sample_values = [{sample:rnd.random() * 100 for sample in rnd.sample(range(3), rnd.randint(0, 3))} for _ in labels]
+    sample_values[0] = {0:0.125, 1:0.0, 2:2.675}
+
+    expect = "Feature\tRank\tS1\tS2\tS3\n" + "".join(label + "\t" + "\t".join("{:.2f}".format(sv[sample]) if sample in sv else "0" for sample in range(3)) + "\n" for label, sv in zip(labels, sample_values))
+    matrix = CountMatrix.from_dicts(labels, sample_values, 3, dtype=np.float64)
+    for block_size in [1, 7, 100]:
+      self.assertEqual(expect, self.write_and_read(matrix, "%.2f", block_size))
+
+  def test_from_dense(self):
+    dense = np.array([[1, 0, 3], [0, 0, 0], [10, 20, 30]], dtype=np.int64)
+    matrix = CountMatrix.from_dense(["a\tx", "b\ty", "c\tz"], dense)
+    self.assertEqual("Feature\tRank\tS1\tS2\tS3\na\tx\t1\t0\t3\nb\ty\t0\t0\t0\nc\tz\t10\t20\t30\n", self.write_and_read(matrix, "%d", 2))
+
+if __name__ == '__main__':
+  unittest.main()
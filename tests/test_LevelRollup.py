@@ -0,0 +1,47 @@
+from context import spcount
+
+from spcount.Query import Query
+from spcount.QueryStore import QueryStore
+from spcount.LevelRollup import LevelRollup
+from spcount.count_util import build_species_list
+from spcount.SymbolTable import SymbolTable
+
+import random
+import unittest
+import numpy as np
+from array import array
+
+class TestLevelRollup(unittest.TestCase):
+  def test_rollup(self):
+    rnd = random.Random(1)
+    species_table = SymbolTable([f"species{i}" for i in range(20)])
+    query_list = []
+    for qi in range(200):
+      species_list = array('i', sorted(rnd.sample(range(20), rnd.randint(1, 4))))
+      query_list.append(Query(rnd.randrange(3), qi, rnd.randint(1, 10), species_list))
+    store = QueryStore.from_query_list(query_list, 3)
+    species_list = build_species_list(query_list, species_table)
+    taxonomy_map = {f"species{i}":{'genus':f"genus{i % 7}", 'family':f"family{i % 3}"} for i in range(20)}
+    species_estimated = np.array([[rnd.random() for _ in range(3)] for _ in species_list])
+
+    rollup = LevelRollup(taxonomy_map, species_list, len(species_table), ['genus', 'family'])
+    result = rollup.rollup(store, species_estimated)
+
+    for level in ['genus', 'family']:
+      cat_names, query_matrix, estimated_matrix = result[level]
+      expect_names = list(dict.fromkeys(taxonomy_map[s.name][level] for s in species_list))
+      expect_query = {}
+      expect_estimated = {}
+      for cat in expect_names:
+        members = [idx for idx, s in enumerate(species_list) if taxonomy_map[s.name][level] == cat]
+        queries = set(q for idx in members for qlist in species_list[idx].queries.values() for q in qlist)
+        expect_query[cat] = [sum(q.count for q in queries if q.sample == sample) for sample in range(3)]
+        expect_estimated[cat] = [sum(species_estimated[idx][sample] for idx in members) for sample in range(3)]
+      expect_names.sort(key=lambda x:sum(expect_query[x]), reverse=True)
+
+      self.assertEqual(expect_names, cat_names)
+      self.assertEqual([expect_query[cat] for cat in cat_names], query_matrix.tolist())
+      self.assertEqual([expect_estimated[cat] for cat in cat_names], estimated_matrix.tolist())
+
+if __name__ == '__main__':
+  unittest.main()
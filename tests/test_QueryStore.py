@@ -0,0 +1,45 @@
+from context import spcount
+
+from spcount.Query import Query
+from spcount.QueryStore import QueryStore
+from spcount.count_util import build_species_list
+from spcount.SymbolTable import SymbolTable
+
+import random
+import unittest
+from array import array
+
+class TestQueryStore(unittest.TestCase):
+  def setUp(self):
+    rnd = random.Random(1)
+    self.species_table = SymbolTable([f"species{i}" for i in range(20)])
+    self.query_list = []
+    for qi in range(200):
+      species_list = array('i', sorted(rnd.sample(range(20), rnd.randint(1, 4))))
+      self.query_list.append(Query(rnd.randrange(3), qi, rnd.randint(1, 10), species_list))
+    self.store = QueryStore.from_query_list(self.query_list, 3)
+
+  def test_sum_by_species(self):
+    species_list = build_species_list(self.query_list, self.species_table)
+    for query in self.query_list:
+      query.estimate_count()
+
+    query_matrix = self.store.sum_by_species(self.store.counts, len(self.species_table))
+    estimated_matrix = self.store.sum_by_species(self.store.estimate_counts(), len(self.species_table))
+    self.assertEqual(query_matrix.dtype, 'int64')
+    for species in species_list:
+      species.sum_estimated_count()
+      for sample in range(3):
+        self.assertEqual(species.sample_query_count.get(sample, 0), query_matrix[species.id, sample])
+        self.assertEqual(species.sample_estimated_count.get(sample, 0), estimated_matrix[species.id, sample])
+
+  def test_sum_by_group(self):
+    groups = self.store.counts % 2
+    matrix = self.store.sum_by_group(groups, self.store.counts, 2)
+    for group in range(2):
+      for sample in range(3):
+        expect = sum(q.count for q in self.query_list if q.sample == sample and q.count % 2 == group)
+        self.assertEqual(expect, matrix[group, sample])
+
+if __name__ == '__main__':
+  unittest.main()
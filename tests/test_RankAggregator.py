@@ -0,0 +1,91 @@
+from context import spcount
+
+from spcount.Query import Query
+from spcount.RankAggregator import RankAggregator
+from spcount.SymbolTable import SymbolTable
+
+import random
+import unittest
+import pandas as pd
+from array import array
+
+def build_species_taxonomy_map(num_species):
+  result = {}
+  for i in range(num_species):
+    result[f"species{i}"] = {
+      'species':f"species{i}",
+      'genus':f"genus{i // 2}" if i % 7 else "Unclassified",
+      'family':f"family{i // 4}",
+      'order':f"order{i // 8}",
+      'class':f"class{i // 16}",
+      'phylum':f"phylum{i // 32}",
+      'superkingdom':"Bacteria",
+    }
+  return(result)
+
+def build_query_list(seed, species_table, num_species, num_queries):
+  rnd = random.Random(seed)
+  species = [f"species{i}" for i in range(num_species)]
+  result = []
+  for qi in range(num_queries):
+    base = rnd.randrange(num_species)
+    species_list = sorted(set(species[min(num_species - 1, base + rnd.randint(0, 3))] for _ in range(rnd.randint(1, 6))))
+    result.append(Query(0, qi, 1, array('i', [species_table.intern(s) for s in species_list])))
+  return(result)
+
+# the value_counts based aggregation of single query
+def expect_aggregate_to_rank(species_list, species_taxonomy_map, rank, aggregate_rate):
+  if rank == "species":
+    return(species_list[0] if len(species_list) == 1 else "AmbiguousRanks")
+  vc = pd.Series([species_taxonomy_map[s][rank] for s in species_list]).value_counts(sort=True, ascending=False)
+  return(vc.keys()[0] if vc.iloc[0] / len(species_list) >= aggregate_rate else "AmbiguousRanks")
+
+def expect_get_unique_rank(species_list, species_taxonomy_map, aggregate_rate):
+  if len(species_list) == 1:
+    return("species", species_list[0])
+  for rank in ['genus', 'family', 'order', 'class', 'phylum', 'superkingdom']:
+    rank_name = expect_aggregate_to_rank(species_list, species_taxonomy_map, rank, aggregate_rate)
+    if rank_name not in ["AmbiguousRanks", "Unclassified"]:
+      return(rank, rank_name)
+
+class TestRankAggregator(unittest.TestCase):
+  def test_aggregate_to_rank(self):
+    species_taxonomy_map = build_species_taxonomy_map(64)
+    species_table = SymbolTable()
+    query_list = build_query_list(1, species_table, 64, 300)
+    aggregator = RankAggregator(species_taxonomy_map, query_list, species_table)
+    for rank in ['species', 'genus', 'family', 'order', 'class', 'phylum']:
+      for aggregate_rate in [0.5, 0.95]:
+        expect = [expect_aggregate_to_rank(species_table.get_names(q.species_list), species_taxonomy_map, rank, aggregate_rate) for q in query_list]
+        actual = [aggregator.get_name(code) for code in aggregator.aggregate_to_rank(rank, aggregate_rate)]
+        self.assertEqual(expect, actual)
+
+  def test_get_unique_rank(self):
+    species_taxonomy_map = build_species_taxonomy_map(64)
+    species_table = SymbolTable()
+    query_list = build_query_list(2, species_table, 64, 300)
+    aggregator = RankAggregator(species_taxonomy_map, query_list, species_table)
+    for aggregate_rate in [0.5, 0.95]:
+      expect = [expect_get_unique_rank(species_table.get_names(q.species_list), species_taxonomy_map, aggregate_rate) for q in query_list]
+      ranks, codes = aggregator.get_unique_rank(aggregate_rate=aggregate_rate)
+      actual = [(rank, aggregator.get_name(code)) for rank, code in zip(ranks, codes)]
+      self.assertEqual(expect, actual)
+
+  def test_cache(self):
+    species_taxonomy_map = build_species_taxonomy_map(64)
+    species_table = SymbolTable()
+    query_list = build_query_list(3, species_table, 64, 300)
+    aggregator = RankAggregator(species_taxonomy_map, query_list, species_table, cache_size=10)
+    set_count = len(aggregator.set_keys)
+    self.assertLess(set_count, len(query_list))
+
+    genus = aggregator.aggregate_to_rank('genus', 0.95)
+    self.assertEqual(0, aggregator.cache.hits)
+    self.assertEqual(set_count, aggregator.cache.misses)
+    self.assertEqual(10, len(aggregator.cache))
+
+    self.assertEqual(genus.tolist(), aggregator.aggregate_to_rank('genus', 0.95).tolist())
+    self.assertEqual(10, aggregator.cache.hits)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,25 @@
+from context import spcount
+
+from spcount.Query import Query
+from spcount.Species import Species
+
+import unittest
+from array import array
+
+class TestSpecies(unittest.TestCase):
+  def test_contains_large_query_id(self):
+    big = Species("big")
+    small = Species("small")
+    for name in [5, 2**31, 2**33 + 7]:
+      big.add_query(Query(0, name, 1, array('i', [0, 1])))
+    small.add_query(Query(0, 2**33 + 7, 1, array('i', [0, 1])))
+    for species in [big, small]:
+      species.build_queries_set()
+      species.sum_query_count()
+
+    self.assertEqual([5, 2**31, 2**33 + 7], list(big.queries_set[0]))
+    self.assertTrue(big.contains(small))
+    self.assertFalse(small.contains(big))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,47 @@
+from context import spcount
+
+from spcount.StageCheckpoint import StageCheckpoint
+
+import logging
+import os
+import tempfile
+import unittest
+
+logger = logging.getLogger('test')
+
+class TestStageCheckpoint(unittest.TestCase):
+  def test_checkpoint(self):
+    with tempfile.TemporaryDirectory() as folder:
+      input_file = os.path.join(folder, "input.txt")
+      with open(input_file, "wt") as fout:
+        fout.write("a\n")
+      checkpoint_folder = os.path.join(folder, "out.checkpoint")
+
+      checkpoint = StageCheckpoint(logger, checkpoint_folder, [input_file], {"rate":0.95})
+      self.assertEqual(None, checkpoint.load("queries"))
+      checkpoint.save("queries", ([1, 2], {"a":1}))
+
+      checkpoint = StageCheckpoint(logger, checkpoint_folder, [input_file], {"rate":0.95})
+      self.assertEqual(([1, 2], {"a":1}), checkpoint.load("queries"))
+
+      checkpoint = StageCheckpoint(logger, checkpoint_folder, [input_file], {"rate":0.9})
+      self.assertEqual(None, checkpoint.load("queries"))
+      self.assertEqual([], os.listdir(checkpoint_folder))
+      checkpoint.save("queries", [3])
+
+      with open(input_file, "wt") as fout:
+        fout.write("b\n")
+      checkpoint = StageCheckpoint(logger, checkpoint_folder, [input_file], {"rate":0.9})
+      self.assertEqual(None, checkpoint.load("queries"))
+
+      checkpoint.save("queries", [3])
+      checkpoint.save("species", [4])
+      checkpoint.remove("queries")
+      self.assertFalse(checkpoint.exists("queries"))
+      self.assertEqual([4], checkpoint.load("species"))
+      checkpoint.remove("queries")
+      checkpoint.clear()
+      self.assertFalse(os.path.exists(checkpoint_folder))
+
+if __name__ == '__main__':
+  unittest.main()
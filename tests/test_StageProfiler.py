@@ -0,0 +1,43 @@
+from context import spcount
+
+from spcount.StageProfiler import StageProfiler
+
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+class TestStageProfiler(unittest.TestCase):
+  def test_profile(self):
+    with tempfile.TemporaryDirectory() as folder:
+      profiler = StageProfiler(cprofile=True)
+      profiler.start("fast")
+      profiler.set_count("reads", 10)
+      profiler.start("slow")
+      time.sleep(0.05)
+      profiler.set_count("queries", 3)
+      profile_json = profiler.save(os.path.join(folder, "out"))
+
+      self.assertEqual(os.path.join(folder, "out.profile.json"), profile_json)
+      with open(profile_json, "rt") as fin:
+        result = json.load(fin)
+      self.assertEqual(["fast", "slow"], [stage["stage"] for stage in result["stages"]])
+      self.assertEqual({"reads":10}, result["stages"][0]["counts"])
+      self.assertEqual({"queries":3}, result["stages"][1]["counts"])
+      self.assertGreaterEqual(result["stages"][1]["wall_seconds"], 0.05)
+      self.assertGreaterEqual(result["total"]["wall_seconds"], result["stages"][1]["wall_seconds"])
+      self.assertEqual("slow", result["cprofile"]["stage"])
+      pstats.Stats(result["cprofile"]["file"])
+
+  def test_no_cprofile(self):
+    with tempfile.TemporaryDirectory() as folder:
+      profiler = StageProfiler()
+      profiler.set_count("reads", 10)
+      profiler.start("stage")
+      profiler.save(os.path.join(folder, "out"))
+      self.assertEqual(["out.profile.json"], os.listdir(folder))
+
+if __name__ == '__main__':
+  unittest.main()
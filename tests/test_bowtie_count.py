@@ -0,0 +1,70 @@
+from context import spcount
+
+from spcount.count_util import bowtie_count
+from spcount.CountBundle import CountBundle
+
+import gzip
+import logging
+import os
+import tempfile
+import unittest
+
+logger = logging.getLogger('test')
+
+class TestBowtieCount(unittest.TestCase):
+  def write_data(self, folder):
+    species_file = os.path.join(folder, "species.txt")
+    with open(species_file, "wt") as fout:
+      fout.write("chrom\tspecies\n")
+      fout.write("chr1\tSpeciesB\nchr2\tSpeciesB\nchr3\tSpeciesA\nchr4\tSpeciesC\n")
+
+    count_file = os.path.join(folder, "sample.dupcount")
+    with open(count_file, "wt") as fout:
+      fout.write("Query\tCount\tSequence\n")
+      fout.write("r1\t3\tAAAA\nr2\t5\tCCCC\nr3\t3\tGGGG\nr4\t9\tTTTT\n")
+
+    bowtie_rows = [
+      ["r1 x\t+\tchr1\t1\n", "r1 x\t+\tchr2\t5\n", "r3\t-\tchr3\t1\n", "r2\t+\tchr4\t1\n"],
+      ["r2\t+\tchr3\t1\n", "r1\t+\tchr4\t1\n"],
+    ]
+    list_file = os.path.join(folder, "list.txt")
+    with open(list_file, "wt") as fl:
+      for idx, rows in enumerate(bowtie_rows):
+        bowtie_file = os.path.join(folder, f"chunk{idx}.bowtie.txt.gz")
+        with gzip.open(bowtie_file, "wt") as fout:
+          fout.writelines(rows)
+        fl.write(f"{bowtie_file}\tchunk{idx}\n")
+    return(list_file, count_file, species_file)
+
+  def run_bowtie_count(self, threads):
+    with tempfile.TemporaryDirectory() as folder:
+      list_file, count_file, species_file = self.write_data(folder)
+      output_file = os.path.join(folder, "sample.count.txt.gz")
+      bowtie_count(logger, list_file, output_file, count_file, species_file, threads=threads)
+      with gzip.open(output_file, "rt") as fin:
+        return(fin.read())
+
+  def test_bowtie_count(self):
+    actual = self.run_bowtie_count(1)
+    self.assertEqual("read\tcount\tsequence\tspecies\n"
+      "r2\t5\tCCCC\tSpeciesA,SpeciesC\n"
+      "r1\t3\tAAAA\tSpeciesB,SpeciesC\n"
+      "r3\t3\tGGGG\tSpeciesA\n", actual)
+
+  def test_bowtie_count_npz(self):
+    with tempfile.TemporaryDirectory() as folder:
+      list_file, count_file, species_file = self.write_data(folder)
+      output_file = os.path.join(folder, "sample.npz")
+      bowtie_count(logger, list_file, output_file, count_file, species_file, output_format="npz")
+      bundle = CountBundle.load(output_file)
+      self.assertEqual(["r2", "r1", "r3"], bundle.get_read_names())
+      self.assertEqual([5, 3, 3], bundle.counts.tolist())
+      self.assertEqual(["CCCC", "AAAA", "GGGG"], bundle.get_sequences())
+      self.assertEqual([["SpeciesA", "SpeciesC"], ["SpeciesB", "SpeciesC"], ["SpeciesA"]], [bundle.get_species_names(row) for row in range(3)])
+      bundle = None
+
+  def test_bowtie_count_threads(self):
+    self.assertEqual(self.run_bowtie_count(1), self.run_bowtie_count(2))
+
+if __name__ == '__main__':
+  unittest.main()
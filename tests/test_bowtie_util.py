@@ -0,0 +1,181 @@
+from context import spcount
+
+from spcount.bowtie_util import bowtie, bowtie_batch, bowtie_collapsed
+from spcount.count_util import bowtie_count
+
+import gzip
+import logging
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+logger = logging.getLogger('test')
+
+# Fake bowtie: maps a fasta read to an index if the last character of index name is in the read name (without sample tag),
+# alignments are written to stdout, unmapped reads are written to --un, and -p is reported in stderr.
+# It fails on index whose name ends with 9.
+FAKE_BOWTIE = '''#!{python}
+import sys
+args = sys.argv[1:]
+thread = args[args.index('-p') + 1]
+unmapped_file = args[args.index('--un') + 1]
+index, input_file = args[-2:]
+if index.endswith("9"):
+  sys.stderr.write("cannot open index\\n")
+  sys.exit(1)
+lines = open(input_file).read().split()
+fout = sys.stdout
+with open(unmapped_file, "w") as fun:
+  for name, seq in zip(lines[0::2], lines[1::2]):
+    if index[-1] in name.split('|')[-1]:
+      fout.write(f"{{name[1:]}} x\\t+\\t{{index.rsplit('/', 1)[-1]}}_chr\\t1\\t{{seq}}\\tIIII\\t0\\t\\n")
+    else:
+      fun.write(f"{{name}}\\n{{seq}}\\n")
+sys.stderr.write(f"threads {{thread}}\\n")
+'''
+
+INDECIES = [("idx1", "bacteria"), ("idx2", "bacteria"), ("idx3", "archaea"), ("idx4", "viral")]
+
+class TestBowtie(unittest.TestCase):
+  def prepare(self, folder, indecies):
+    bin_folder = os.path.join(folder, "bin")
+    os.makedirs(bin_folder)
+    fake_bowtie = os.path.join(bin_folder, "bowtie")
+    with open(fake_bowtie, "wt") as fout:
+      fout.write(FAKE_BOWTIE.format(python=sys.executable))
+    os.chmod(fake_bowtie, os.stat(fake_bowtie).st_mode | stat.S_IEXEC)
+
+    input_file = os.path.join(folder, "input.fasta")
+    with open(input_file, "wt") as fout:
+      for name in ["r1", "r2", "r12", "r3", "r4", "r34"]:
+        fout.write(f">{name}\nACGT\n")
+
+    list_file = os.path.join(folder, "index.list")
+    with open(list_file, "wt") as fout:
+      fout.write("BowtieIndex\tCategory\tFasta\n")
+      for index, category in indecies:
+        index_path = os.path.join(folder, index)
+        open(index_path + ".rev.2.ebwt", "wt").close()
+        fout.write(f"{index_path}\t{category}\t{index_path}.fa\n")
+    return(bin_folder, input_file, list_file)
+
+  def run_bowtie(self, category_jobs, indecies=INDECIES):
+    with tempfile.TemporaryDirectory() as folder:
+      bin_folder, input_file, list_file = self.prepare(folder, indecies)
+      old_path = os.environ["PATH"]
+      os.environ["PATH"] = bin_folder + os.pathsep + old_path
+      try:
+        output_file = os.path.join(folder, "output.txt")
+        bowtie(logger, input_file, output_file, list_file, 4, isFasta=True, categoryJobs=category_jobs)
+      finally:
+        os.environ["PATH"] = old_path
+      with open(output_file, "rt") as fin:
+        output = fin.read()
+      with open(output_file + ".log", "rt") as fin:
+        log = fin.read()
+      self.assertEqual(["index.list", "input.fasta", "output.txt", "output.txt.log"], sorted(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)) and not ".ebwt" in f))
+      return(output, log)
+
+  def test_bowtie(self):
+    output, log = self.run_bowtie(1)
+    rows = [line.split("\t") for line in output.splitlines()]
+    self.assertEqual([["r3", "archaea"], ["r34", "archaea"], ["r1", "bacteria"], ["r12", "bacteria"], ["r2", "bacteria"], ["r4", "viral"], ["r34", "viral"]], [[row[0], row[4]] for row in rows])
+    self.assertEqual(">archaea\nthreads 4\n>bacteria\nthreads 4\nthreads 4\n>viral\nthreads 4\n", log)
+
+  def test_bowtie_category_jobs(self):
+    output, log = self.run_bowtie(1)
+    output_jobs, log_jobs = self.run_bowtie(2)
+    self.assertEqual(output, output_jobs)
+    self.assertEqual(log.replace("threads 4", "threads 2"), log_jobs)
+
+  def test_bowtie_failed(self):
+    with self.assertRaises(Exception) as context:
+      self.run_bowtie(2, INDECIES + [("idx9", "fungi")])
+    self.assertIn("exit code 1", str(context.exception))
+
+  def test_bowtie_batch(self):
+    with tempfile.TemporaryDirectory() as folder:
+      bin_folder, input_file, list_file = self.prepare(folder, INDECIES)
+      fastq_file = os.path.join(folder, "input2.fastq.gz")
+      with gzip.open(fastq_file, "wt") as fout:
+        for name in ["r2", "r4", "r23"]:
+          fout.write(f"@{name} 1:N\nACGT\n+\nIIII\n")
+      sample_list_file = os.path.join(folder, "sample.list")
+      with open(sample_list_file, "wt") as fout:
+        fout.write(f"{input_file}\tA\n{fastq_file}\tB\n")
+
+      old_path = os.environ["PATH"]
+      os.environ["PATH"] = bin_folder + os.pathsep + old_path
+      try:
+        output_prefix = os.path.join(folder, "batch")
+        bowtie_batch(logger, sample_list_file, output_prefix, list_file, 4, categoryJobs=2)
+      finally:
+        os.environ["PATH"] = old_path
+
+      with open(output_prefix + ".list", "rt") as fin:
+        sample_files = [line.rstrip().split("\t") for line in fin]
+      self.assertEqual([[output_prefix + ".A.bowtie.txt", "A"], [output_prefix + ".B.bowtie.txt", "B"]], sample_files)
+
+      with open(output_prefix + ".A.bowtie.txt", "rt") as fin:
+        rows = [line.rstrip().split("\t") for line in fin]
+      self.assertEqual([["r3", "archaea"], ["r34", "archaea"], ["r1", "bacteria"], ["r12", "bacteria"], ["r2", "bacteria"], ["r4", "viral"], ["r34", "viral"]], [[row[0], row[4]] for row in rows])
+      self.assertEqual(["r3", "+", "idx3_chr", "1", "archaea"], rows[0])
+
+      with open(output_prefix + ".B.bowtie.txt", "rt") as fin:
+        rows = [line.rstrip().split("\t") for line in fin]
+      self.assertEqual([["r23", "archaea"], ["r2", "bacteria"], ["r23", "bacteria"], ["r4", "viral"]], [[row[0], row[4]] for row in rows])
+
+      self.assertFalse(os.path.exists(output_prefix + ".batch.txt"))
+      self.assertFalse(os.path.exists(output_prefix + ".batch.fasta"))
+
+      # demultiplexed output is used by bowtie_count directly
+      species_file = os.path.join(folder, "species.txt")
+      with open(species_file, "wt") as fout:
+        fout.write("chrom\tspecies\nidx1_chr\tSpeciesA\nidx2_chr\tSpeciesB\nidx3_chr\tSpeciesC\nidx4_chr\tSpeciesD\n")
+      dupcount_file = os.path.join(folder, "B.dupcount")
+      with open(dupcount_file, "wt") as fout:
+        fout.write("Query\tCount\tSequence\nr2\t5\tACGT\nr4\t2\tACGT\nr23\t1\tACGT\n")
+      bowtie_list_file = os.path.join(folder, "B.bowtie.list")
+      with open(bowtie_list_file, "wt") as fout:
+        fout.write(f"{output_prefix}.B.bowtie.txt\n")
+      count_file = os.path.join(folder, "B.count.txt.gz")
+      bowtie_count(logger, bowtie_list_file, count_file, dupcount_file, species_file)
+      with gzip.open(count_file, "rt") as fin:
+        self.assertEqual("read\tcount\tsequence\tspecies\nr2\t5\tACGT\tSpeciesB\nr4\t2\tACGT\tSpeciesD\nr23\t1\tACGT\tSpeciesB,SpeciesC\n", fin.read())
+
+  def test_bowtie_collapsed(self):
+    with tempfile.TemporaryDirectory() as folder:
+      bin_folder, _, list_file = self.prepare(folder, INDECIES)
+      fastq_file = os.path.join(folder, "input.fastq")
+      with open(fastq_file, "wt") as fout:
+        for name, sequence in [("r1", "ACGT"), ("r2", "ACGT"), ("r3", "CCCC"), ("r1x", "ACGT"), ("r23", "TTTT")]:
+          fout.write(f"@{name} 1:N\n{sequence}\n+\nIIII\n")
+
+      old_path = os.environ["PATH"]
+      os.environ["PATH"] = bin_folder + os.pathsep + old_path
+      try:
+        output_file = os.path.join(folder, "output.txt")
+        bowtie_collapsed(logger, fastq_file, output_file, list_file, 4)
+      finally:
+        os.environ["PATH"] = old_path
+
+      with open(output_file, "rt") as fin:
+        rows = [line.rstrip().split("\t") for line in fin]
+      self.assertEqual([["r3", "archaea"], ["r23", "archaea"], ["r1", "bacteria"], ["r23", "bacteria"]], [[row[0], row[4]] for row in rows])
+      self.assertFalse(os.path.exists(output_file + ".fasta"))
+
+      species_file = os.path.join(folder, "species.txt")
+      with open(species_file, "wt") as fout:
+        fout.write("chrom\tspecies\nidx1_chr\tSpeciesA\nidx2_chr\tSpeciesB\nidx3_chr\tSpeciesC\nidx4_chr\tSpeciesD\n")
+      bowtie_list_file = os.path.join(folder, "bowtie.list")
+      with open(bowtie_list_file, "wt") as fout:
+        fout.write(f"{output_file}\n")
+      count_file = os.path.join(folder, "output.count.txt.gz")
+      bowtie_count(logger, bowtie_list_file, count_file, output_file + ".dupcount", species_file)
+      with gzip.open(count_file, "rt") as fin:
+        self.assertEqual("read\tcount\tsequence\tspecies\nr1\t3\tACGT\tSpeciesA\nr3\t1\tCCCC\tSpeciesC\nr23\t1\tTTTT\tSpeciesB,SpeciesC\n", fin.read())
+
+if __name__ == '__main__':
+  unittest.main()
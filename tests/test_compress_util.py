@@ -0,0 +1,41 @@
+from context import spcount
+
+from spcount.compress_util import open_compressed, ProcessFile, get_available_backends, get_isal_level
+
+import gzip
+import os
+import tempfile
+import unittest
+
+class TestCompressUtil(unittest.TestCase):
+  def test_backends(self):
+    content = "".join(f"line{idx}\n" for idx in range(1000))
+    with tempfile.TemporaryDirectory() as folder:
+      for backend in get_available_backends():
+        filename = os.path.join(folder, f"{backend}.txt.gz")
+        with open_compressed(filename, "wt", level=1, backend=backend) as fout:
+          fout.write(content)
+        with gzip.open(filename, "rt") as fin:
+          self.assertEqual(content, fin.read())
+        with open_compressed(filename, "rt", backend=backend) as fin:
+          self.assertEqual(content, fin.read())
+
+  def test_process_file(self):
+    content = "".join(f"line{idx}\n" for idx in range(100000))
+    with tempfile.TemporaryDirectory() as folder:
+      filename = os.path.join(folder, "test.txt.gz")
+      with ProcessFile(filename, "wt", ["gzip", "-c"]) as fout:
+        fout.write(content)
+      with ProcessFile(filename, "rt", ["gzip", "-dc"]) as fin:
+        self.assertEqual(["line0\n", "line1\n"], [fin.readline(), fin.readline()])
+      with ProcessFile(filename, "rt", ["gzip", "-dc"]) as fin:
+        self.assertEqual(content, fin.read())
+      with self.assertRaises(Exception):
+        with ProcessFile(os.path.join(folder, "missing.gz"), "rt", ["gzip", "-dc"]) as fin:
+          fin.read()
+
+  def test_get_isal_level(self):
+    self.assertEqual([0, 1, 1, 1, 2, 2, 2, 3, 3, 3], [get_isal_level(level) for level in range(10)])
+
+if __name__ == '__main__':
+  unittest.main()
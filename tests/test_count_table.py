@@ -0,0 +1,94 @@
+from context import spcount
+
+from spcount.Query import Query
+from spcount.SymbolTable import SymbolTable
+from spcount.count_util import merge_queries, read_query_list, build_species_list, mark_subset_species, mark_subset_species_legacy, mark_identical_species, mark_identical_species_legacy
+
+import gzip
+import logging
+import os
+import random
+import tempfile
+from array import array
+import unittest
+
+logger = logging.getLogger('test')
+
+def build_random_query_list(seed, species_table, num_species=30, num_queries=400, num_samples=3):
+  rnd = random.Random(seed)
+  species = [f"species{i}" for i in range(num_species)]
+  result = []
+  for qi in range(num_queries):
+    species_list = rnd.sample(species, rnd.randint(1, 4))
+    # species with odd index always come with its previous species, so they become subset.
+    # species with index 4n and 4n+1 always come together, so they are identical.
+    indecies = set(species.index(s) for s in species_list)
+    indecies.update([i - 1 for i in indecies if i % 2 == 1] + [i + 1 for i in indecies if i % 4 == 0])
+    species_list = array('i', [species_table.intern(species[i]) for i in sorted(indecies)])
+    result.append(Query(rnd.randrange(num_samples), qi, rnd.randint(1, 10), species_list))
+  return(result)
+
+class TestCountTable(unittest.TestCase):
+  def test_merge_queries(self):
+    queries = [
+      Query(0, 1, 5, array('i', [0, 1])),
+      Query(0, 2, 3, array('i', [2])),
+      Query(0, 3, 2, array('i', [0, 1])),
+      Query(0, 4, 1, array('i', [2])),
+      Query(0, 5, 1, array('i', [0, 2])),
+    ]
+    actual = merge_queries(logger, queries)
+    self.assertEqual([1, 5, 2], [q.name for q in actual])
+    self.assertEqual([7, 1, 4], [q.count for q in actual])
+
+  def test_mark_subset_species(self):
+    for seed in range(5):
+      species_table = SymbolTable()
+      expect_list = build_species_list(build_random_query_list(seed, species_table), species_table)
+      mark_subset_species_legacy(logger, expect_list)
+
+      species_table = SymbolTable()
+      actual_list = build_species_list(build_random_query_list(seed, species_table), species_table)
+      mark_subset_species(logger, actual_list)
+
+      self.assertEqual([s.name for s in expect_list], [s.name for s in actual_list])
+      self.assertEqual([s.is_subset for s in expect_list], [s.is_subset for s in actual_list])
+      self.assertTrue(any(s.is_subset for s in actual_list))
+  def test_mark_identical_species(self):
+    for seed in range(5):
+      species_table = SymbolTable()
+      expect_list = build_species_list(build_random_query_list(seed, species_table), species_table)
+      mark_identical_species_legacy(logger, expect_list)
+
+      species_table = SymbolTable()
+      actual_list = build_species_list(build_random_query_list(seed, species_table), species_table)
+      mark_identical_species(logger, actual_list)
+
+      self.assertEqual([s.is_identical for s in expect_list], [s.is_identical for s in actual_list])
+      self.assertEqual([[i.name for i in s.identical_species] for s in expect_list], [[i.name for i in s.identical_species] for s in actual_list])
+      self.assertTrue(any(s.is_identical for s in actual_list))
+
+  def test_read_query_list_threads(self):
+    rnd = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+      file_map = {}
+      for sample in ["S1", "S2", "S3"]:
+        count_file = os.path.join(folder, f"{sample}.count.txt.gz")
+        with gzip.open(count_file, "wt") as fout:
+          fout.write("read\tcount\tsequence\tspecies\n")
+          for ri in range(200):
+            species = ",".join(rnd.sample([f"species{i}" for i in range(20)], rnd.randint(1, 3)))
+            fout.write(f"{sample}_{ri}\t{rnd.randint(1, 10)}\tACGT\t{species}\n")
+        file_map[sample] = count_file
+
+      expect_table = SymbolTable()
+      expect_list = read_query_list(logger, file_map, expect_table)
+      actual_table = SymbolTable()
+      actual_list = read_query_list(logger, file_map, actual_table, threads=2)
+
+    self.assertEqual(expect_table.names, actual_table.names)
+    self.assertEqual([(q.sample, q.name, q.count, list(q.species_list)) for q in expect_list],
+      [(q.sample, q.name, q.count, list(q.species_list)) for q in actual_list])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,56 @@
+from context import spcount
+
+from spcount.fastq_util import collapse_fastq, collapse_fastq_to_fasta
+
+import gzip
+import logging
+import os
+import random
+import tempfile
+import unittest
+
+logger = logging.getLogger('test')
+
+class TestFastqUtil(unittest.TestCase):
+  def test_collapse_fastq_to_fasta(self):
+    with tempfile.TemporaryDirectory() as folder:
+      fastq_file = os.path.join(folder, "input.fastq.gz")
+      with gzip.open(fastq_file, "wt") as fout:
+        for idx, sequence in enumerate(["ACGT", "GGGG", "ACGT", "TTTT", "GGGG", "ACGT", "TTTT", "CCCC"]):
+          fout.write(f"@r{idx} 1:N:0\n{sequence}\n+\n{'I' * len(sequence)}\n")
+
+      fasta_file = os.path.join(folder, "output.fasta")
+      dupcount_file = os.path.join(folder, "output.dupcount")
+      self.assertEqual((8, 4), collapse_fastq_to_fasta(logger, fastq_file, fasta_file, dupcount_file))
+
+      with open(fasta_file, "rt") as fin:
+        self.assertEqual(">r0\nACGT\n>r1\nGGGG\n>r3\nTTTT\n>r7\nCCCC\n", fin.read())
+
+      collapse_fastq(logger, fastq_file, os.path.join(folder, "collapsed.fastq"))
+      with open(dupcount_file, "rt") as fin, open(os.path.join(folder, "collapsed.fastq.dupcount"), "rt") as fexpect:
+        self.assertEqual(fexpect.read(), fin.read())
+
+  def test_collapse_fastq_by_buckets(self):
+    with tempfile.TemporaryDirectory() as folder:
+      rnd = random.Random(1)
+      sequences = ["".join(rnd.choice("ACGT") for _ in range(rnd.randint(15, 25))) for _ in range(200)]
+      fastq_file = os.path.join(folder, "input.fastq.gz")
+      with gzip.open(fastq_file, "wt") as fout:
+        for idx in range(5000):
+          sequence = sequences[min(int(rnd.expovariate(0.02)), 199)]
+          fout.write(f"@r{idx} 1:N:0\n{sequence}\n+\n{'I' * len(sequence)}\n")
+
+      collapse_fastq(logger, fastq_file, os.path.join(folder, "memory.fastq"))
+      collapse_fastq(logger, fastq_file, os.path.join(folder, "bucket.fastq"), memory_mb=0.01)
+      for suffix in [".gz", ".dupcount"]:
+        with open(os.path.join(folder, "memory.fastq" + suffix), "rb") as fexpect, open(os.path.join(folder, "bucket.fastq" + suffix), "rb") as fin:
+          expect = fexpect.read()
+          actual = fin.read()
+        if suffix == ".gz":
+          expect = gzip.decompress(expect)
+          actual = gzip.decompress(actual)
+        self.assertEqual(expect, actual)
+      self.assertEqual(["bucket.fastq.dupcount", "bucket.fastq.gz", "input.fastq.gz", "memory.fastq.dupcount", "memory.fastq.gz"], sorted(os.listdir(folder)))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,46 @@
+from context import spcount
+
+from spcount.count_util import read_sequence_list, output_count_list
+from spcount.read_count_util import write_read_count_table
+
+import gzip
+import logging
+import os
+import random
+import tempfile
+import unittest
+
+logger = logging.getLogger('test')
+
+class TestReadCountUtil(unittest.TestCase):
+  def test_write_read_count_table(self):
+    rnd = random.Random(1)
+    sequences = ["".join(rnd.choice("ACGT") for _ in range(rnd.randint(3, 6))) for _ in range(300)]
+    with tempfile.TemporaryDirectory() as folder:
+      file_map = {}
+      for sample in ["S1", "S2", "S3"]:
+        count_file = os.path.join(folder, f"{sample}.count.txt.gz")
+        with gzip.open(count_file, "wt") as fout:
+          fout.write("read\tcount\tsequence\tspecies\n")
+          for ri, seq in enumerate(rnd.sample(sequences, 150)):
+            fout.write(f"{sample}_{ri}\t{rnd.randint(1, 5)}\t{seq}\tspecies1\n")
+        file_map[sample] = count_file
+
+      samples = list(file_map.keys())
+      sequence_list = read_sequence_list(logger, file_map)
+      expect_file = os.path.join(folder, "expect.read.count")
+      output_count_list(expect_file, [s.seq for s in sequence_list], [s.sample_query_count for s in sequence_list], samples,
+        label_headers=["Sequence"], sample_index={sample:idx for idx, sample in enumerate(samples)})
+
+      actual_file = os.path.join(folder, "actual.read.count")
+      write_read_count_table(logger, file_map, actual_file, memory_mb=0.002)
+
+      with open(expect_file, "rt") as fin:
+        expect = fin.read()
+      with open(actual_file, "rt") as fin:
+        actual = fin.read()
+      self.assertEqual(expect, actual)
+      self.assertEqual(["S1.count.txt.gz", "S2.count.txt.gz", "S3.count.txt.gz", "actual.read.count", "expect.read.count"], sorted(os.listdir(folder)))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,39 @@
+from context import spcount
+
+from spcount.sample_cache_util import read_sample_cached
+
+import os
+import tempfile
+import unittest
+
+def read_lines(logger, debug_mode, count_file):
+  read_lines.calls += 1
+  with open(count_file, "rt") as fin:
+    return(fin.readlines())
+read_lines.calls = 0
+
+class TestSampleCacheUtil(unittest.TestCase):
+  def test_read_sample_cached(self):
+    with tempfile.TemporaryDirectory() as folder:
+      cache_dir = os.path.join(folder, "cache")
+      os.makedirs(cache_dir)
+      count_file = os.path.join(folder, "sample.txt")
+      with open(count_file, "wt") as fout:
+        fout.write("a\nb\n")
+
+      read_lines.calls = 0
+      self.assertEqual(["a\n", "b\n"], read_sample_cached(cache_dir, "lines", read_lines, None, False, count_file))
+      self.assertEqual(["a\n", "b\n"], read_sample_cached(cache_dir, "lines", read_lines, None, False, count_file))
+      self.assertEqual(1, read_lines.calls)
+
+      with open(count_file, "at") as fout:
+        fout.write("c\n")
+      self.assertEqual(["a\n", "b\n", "c\n"], read_sample_cached(cache_dir, "lines", read_lines, None, False, count_file))
+      self.assertEqual(2, read_lines.calls)
+      self.assertEqual(1, len(os.listdir(cache_dir)))
+
+      read_sample_cached(cache_dir, "lines", read_lines, None, True, count_file)
+      self.assertEqual(3, read_lines.calls)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,18 @@
+from context import spcount
+
+from spcount.statistic_util import do_shannon
+
+import math
+import unittest
+import pandas as pd
+
+class TestStatisticUtil(unittest.TestCase):
+  def test_do_shannon(self):
+    count_data = pd.DataFrame({"S1":[1, 1, 2], "S2":[5, 0, 0]}, index=["A", "B", "C"])
+    shannon_values = do_shannon(count_data)
+    self.assertAlmostEqual(shannon_values["S1"], -(0.25 * math.log(0.25) * 2 + 0.5 * math.log(0.5)))
+    self.assertAlmostEqual(shannon_values["S2"], 0)
+    self.assertEqual(shannon_values.name, "shannon")
+
+if __name__ == '__main__':
+  unittest.main()